@@ -1,13 +1,36 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from contextlib import asynccontextmanager
+from typing import List, Literal, Optional
 import uvicorn
 import os
+import json
+import time
+import threading
 from src.workflow import Workflow
+from src.models import RecommendationSummary, StackRecommendationState, TechStack
+from src.cache import normalize_key, shared_cache
+from src.singleflight import SingleFlight
+from src.admission import BATCH, INTERACTIVE, AdmissionController, Rejected, register_metrics
+from src.batch import BatchItem, batch_record, parse_batch_line
+from src.metrics import REGISTRY, HTTP_DURATION
+from src.clients import close_clients, warm_up
 
 
-app = FastAPI(title="Tech Stack Recommender API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # runs in each worker after the fork, so clients and connections are per process
+    get_workflow()
+    # open the deepseek/firecrawl connections before the first search pays for the handshake
+    if os.getenv("HTTP_WARMUP", "1") == "1":
+        await warm_up()
+    yield
+    await close_clients()
+
+
+app = FastAPI(title="Tech Stack Recommender API", version="1.0.0", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -18,105 +41,317 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize workflow
-workflow = Workflow()
+@app.middleware("http")
+async def record_request_duration(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # label by route template rather than raw path to keep cardinality bounded
+    route = request.scope.get("route")
+    HTTP_DURATION.observe(
+        time.perf_counter() - start,
+        method=request.method,
+        path=getattr(route, "path", "unmatched"),
+        status=str(response.status_code),
+    )
+    return response
 
 
-class SearchRequest(BaseModel):
-    query: str
+# every workflow run goes through admission control: per-client rate
+# limits, then a capped number of concurrent runs with a short queue.
+# the limits are for the whole server; each worker process (gunicorn
+# exports WEB_CONCURRENCY to them) enforces its share
+WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+admission = AdmissionController(
+    max_concurrency=max(1, int(os.getenv("ADMISSION_MAX_CONCURRENCY", "8")) // WORKERS),
+    max_queue=max(1, int(os.getenv("ADMISSION_QUEUE_SIZE", "32")) // WORKERS),
+    queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10")),
+    rate=float(os.getenv("RATE_LIMIT_PER_MINUTE", "30")) / 60 / WORKERS,
+    burst=max(1.0, float(os.getenv("RATE_LIMIT_BURST", "10")) / WORKERS),
+)
+register_metrics(admission)
+# behind railway/vercel the peer is the proxy; trust its X-Forwarded-For
+TRUST_PROXY = os.getenv("TRUST_PROXY", "0") == "1"
+
+
+def client_id(request: Request) -> str:
+    if TRUST_PROXY:
+        forwarded = request.headers.get("x-forwarded-for", "")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
 
 
-class TechComponent(BaseModel):
-    name: str
-    category: str
-    description: str
-    pros: List[str]
-    cons: List[str]
-    learningCurve: str
-    popularity: str
-    cost: str
-    useCases: List[str]
-
-
-class TechStackResponse(BaseModel):
-    name: str
-    description: str
-    components: List[TechComponent]
-    complexity: str
-    timeToMarket: str
-    scalability: str
-    costEstimate: str
-    teamSizeFit: str
-    bestFor: List[str]
-    industries: List[str]
-    learningResources: List[str]
+@app.exception_handler(Rejected)
+async def rejected_handler(request: Request, exc: Rejected):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.reason},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+# per-node timings of each search in a Server-Timing response header
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1") == "1"
+
+# built on first use rather than at import, so a preloading server
+# doesn't open clients in the parent before forking its workers
+workflow: Optional[Workflow] = None
+_workflow_lock = threading.Lock()
+
+
+def get_workflow() -> Workflow:
+    global workflow
+    with _workflow_lock:
+        if workflow is None:
+            workflow = Workflow()
+        return workflow
+
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+
+# identical queries arriving together share one workflow run, across
+# worker processes too through the shared cache backend
+search_memo_ttl = float(os.getenv("SEARCH_MEMO_TTL", "30"))
+search_flight = SingleFlight(
+    ttl=search_memo_ttl,
+    max_entries=int(os.getenv("SEARCH_MEMO_SIZE", "256")),
+    # opened in the worker on first use, not when this module is imported
+    open_shared=lambda: shared_cache("search", max_entries=int(os.getenv("SEARCH_MEMO_SIZE", "256")), ttl=search_memo_ttl),
+    dump=lambda state: state.model_dump(mode="json"),
+    load=StackRecommendationState.model_validate,
+)
+
+
+class SearchRequest(BaseModel):
+    query: str
+    # serial (default), parallel, or off to skip web research entirely
+    researchMode: Optional[Literal["serial", "parallel", "off"]] = None
+    # threadId from an earlier response: retrying resumes that run, and
+    # regenerate writes new stacks from its saved requirements and research
+    threadId: Optional[str] = None
+    regenerate: bool = False
 
 
 class SearchResponse(BaseModel):
-    stacks: List[TechStackResponse]
+    # TechStack serializes with camelCase aliases, which is what the frontend reads
+    stacks: List[TechStack]
     analysis: str
+    threadId: Optional[str] = None
+
+
+def to_search_response(result) -> SearchResponse:
+    return SearchResponse(
+        stacks=result.recommended_stacks,
+        analysis=result.analysis or RecommendationSummary().analysis,
+        threadId=result.thread_id,
+    )
 
 
 @app.post("/api/search", response_model=SearchResponse)
-async def search_stacks(request: SearchRequest):
+async def search_stacks(request: SearchRequest, response: Response, http_request: Request):
     """Get tech stack recommendations based on project description"""
     try:
         if not request.query.strip():
             raise HTTPException(status_code=400, detail="Query cannot be empty")
-        
-        # Run the workflow
-        result = workflow.run(request.query)
-        
-        # Transform backend data to frontend format
-        stacks = []
-        for stack in result.recommended_stacks:
-            components = []
-            for comp in stack.components:
-                component = TechComponent(
-                    name=comp.name,
-                    category=comp.category,
-                    description=comp.description,
-                    pros=comp.pros,
-                    cons=comp.cons,
-                    learningCurve=comp.learning_curve,
-                    popularity=comp.popularity,
-                    cost=comp.cost,
-                    useCases=comp.use_cases
+        admission.check_rate(client_id(http_request))
+
+        # Run the workflow; coalesced and memoized callers share one slot
+        workflow = get_workflow()
+        mode = request.researchMode or workflow.research_mode
+
+        async def run():
+            async with admission.slot(INTERACTIVE):
+                return await workflow.arun(
+                    request.query, research_mode=mode, thread_id=request.threadId, regenerate=request.regenerate
                 )
-                components.append(component)
-            
-            stack_response = TechStackResponse(
-                name=stack.name,
-                description=stack.description,
-                components=components,
-                complexity=stack.complexity,
-                timeToMarket=stack.time_to_market,
-                scalability=stack.scalability,
-                costEstimate=stack.cost_estimate,
-                teamSizeFit=stack.team_size_fit,
-                bestFor=stack.best_for,
-                industries=stack.industries,
-                learningResources=stack.learning_resources
+
+        if request.regenerate:
+            # asked for a new answer, so never the memoized one
+            result = await run()
+        else:
+            result = await search_flight.do(
+                f"{mode}:{request.threadId or ''}:{normalize_key(request.query)}",
+                run,
+                cacheable=lambda state: bool(state.recommended_stacks),
             )
-            stacks.append(stack_response)
         
-        response = SearchResponse(
-            stacks=stacks,
-            analysis=result.analysis or "Tech stack recommendations generated successfully."
-        )
-        
-        return response
+        if SERVER_TIMING and result.timings:
+            response.headers["Server-Timing"] = ", ".join(
+                f"{node};dur={seconds * 1000:.1f}" for node, seconds in result.timings.items()
+            )
+
+        return to_search_response(result)
         
+    except Rejected:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
 
 
+def format_event(event: str, data) -> str:
+    if event in ("requirements", "stack"):
+        payload = data.model_dump(by_alias=True)
+    elif event == "component":
+        payload = {
+            "stackIndex": data["stack_index"],
+            "component": data["component"].model_dump(by_alias=True),
+        }
+    elif event == "evidence":
+        payload = {"stackIndex": data["stack_index"], "learningResources": data["learning_resources"]}
+    elif event == "analysis":
+        payload = {"analysis": data}
+    elif event == "done":
+        payload = {
+            "cacheHit": data["cache_hit"],
+            "catalogHit": data["catalog_hit"],
+            "timings": data["timings"],
+            "promptTokens": data["prompt_tokens"],
+            "threadId": data["thread_id"],
+        }
+    else:
+        payload = data
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+async def stream_search(
+    client: str,
+    query: str,
+    research_mode: Optional[str] = None,
+    thread_id: Optional[str] = None,
+    regenerate: bool = False,
+) -> StreamingResponse:
+    if not query.strip():
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+    # over the rate or a full queue is still a 429/503 before the response starts
+    admission.check_rate(client)
+    admission.check_queue()
+
+    async def events():
+        # the slot is taken once the body is read: a response that is never
+        # sent never runs this, so it can't hold a slot
+        try:
+            async with admission.slot(INTERACTIVE):
+                async for event, data in get_workflow().astream(
+                    query, research_mode=research_mode, thread_id=thread_id, regenerate=regenerate
+                ):
+                    yield format_event(event, data)
+        except Rejected as e:
+            yield format_event("error", {"message": e.reason, "retryAfter": e.retry_after})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/api/search/stream")
+async def search_stacks_stream(request: SearchRequest, http_request: Request):
+    """Stream recommendations as server-sent events while the workflow runs"""
+    return await stream_search(
+        client_id(http_request), request.query, request.researchMode, request.threadId, request.regenerate
+    )
+
+
+@app.get("/api/search/stream")
+async def search_stacks_stream_get(
+    http_request: Request,
+    query: str,
+    researchMode: Optional[Literal["serial", "parallel", "off"]] = None,
+    threadId: Optional[str] = None,
+    regenerate: bool = False,
+):
+    """EventSource-friendly variant of the streaming search"""
+    return await stream_search(client_id(http_request), query, researchMode, threadId, regenerate)
+
+
+def search_record(result) -> dict:
+    return to_search_response(result).model_dump(by_alias=True)
+
+
+@app.post("/api/search/batch")
+async def search_batch(
+    request: Request,
+    concurrency: int = Query(4, ge=1, le=BATCH_MAX_CONCURRENCY),
+    researchMode: Optional[Literal["serial", "parallel", "off"]] = None,
+):
+    """Run a JSONL body of queries with bounded concurrency, streaming JSONL results back.
+
+    Each input line is {"query": "...", "id": "..."} or a JSON string. Results
+    arrive in completion order, one line per input line, and a bad line or
+    failed query only marks that line as an error.
+    """
+    lines = [line for line in (await request.body()).decode().splitlines() if line.strip()]
+    if not lines:
+        raise HTTPException(status_code=400, detail="Batch body must contain at least one JSONL line")
+    if len(lines) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch is limited to {BATCH_MAX_ITEMS} queries")
+
+    items: List[BatchItem] = []
+    positions: List[int] = []
+    invalid = []
+    for index, line in enumerate(lines):
+        try:
+            items.append(parse_batch_line(line))
+            positions.append(index)
+        except Exception as e:
+            invalid.append(batch_record(index, None, error=e))
+
+    # a batch costs a token per query (up to the burst)
+    admission.check_rate(client_id(request), cost=max(len(items), 1))
+    if items:
+        admission.check_queue()
+
+    async def results():
+        for record in invalid:
+            yield record
+        if not items:
+            return
+        # each query takes a batch slot as it starts, behind waiting searches,
+        # so a batch never holds more slots than it has queries running; a
+        # query that times out waiting is marked as an error like a failed one
+        start = time.perf_counter()
+        failed = 0
+        async for position, output in get_workflow().abatch(
+            [item.query for item in items],
+            max_concurrency=concurrency,
+            research_mode=researchMode,
+            slot=lambda: admission.slot(BATCH),
+        ):
+            index, item = positions[position], items[position]
+            if isinstance(output, Exception):
+                failed += 1
+                yield batch_record(index, item, error=output)
+            else:
+                yield batch_record(index, item, result=output, serialize=search_record)
+        print(f"Batch of {len(items)} queries finished in {time.perf_counter() - start:.1f}s, {failed} failed")
+
+    return StreamingResponse(
+        results(),
+        media_type="application/x-ndjson",
+        headers={"X-Batch-Size": str(len(lines))},
+    )
+
+
 @app.get("/api/health")
 async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "message": "Tech Stack Recommender API is running"}
 
 
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics: node timings, LLM calls and tokens, Firecrawl calls"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/stats")
+async def cache_stats():
+    """Cache hit rates, Firecrawl call counts and admission control"""
+    return {**get_workflow().cache_stats(), "search": search_flight.stats(), "admission": admission.stats()}
+
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
     uvicorn.run(app, host="0.0.0.0", port=port)
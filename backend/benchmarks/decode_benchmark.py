@@ -0,0 +1,158 @@
+# decode_benchmark.py
+#
+# per-response cpu time and allocations of turning a streamed recommendation
+# reply into the api's camelCase json. "legacy" is the previous path (every
+# object json.loads-ed as it closes, fields copied over with .get() defaults,
+# then copied again into the camelCase response models); "validated" is the
+# current one (raw object text straight into model_validate_json, serialized
+# by alias). the streaming tokenizer is the same for both, so it runs once
+# up front and only the decode step is timed.
+#
+#   python -m benchmarks.decode_benchmark --runs 500
+
+import argparse
+import json
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+from src.models import RecommendationSummary, TechStack, TechStackComponent
+from src.parsing import IncrementalJSONParser
+
+from .fakes import PAYLOADS_DIR, load_payloads
+
+
+Events = List[Tuple[tuple, str]]
+
+
+def parse_events(text: str, chunk_size: int) -> Events:
+    parser = IncrementalJSONParser()
+    events = []
+    for start in range(0, len(text), chunk_size):
+        events.extend(parser.feed(text[start:start + chunk_size]))
+    return events
+
+
+def legacy_component(data: Dict[str, Any]) -> TechStackComponent:
+    return TechStackComponent(
+        name=data.get("name", ""),
+        category=data.get("category", ""),
+        description=data.get("description", ""),
+        pros=data.get("pros", []),
+        cons=data.get("cons", []),
+        learning_curve=data.get("learning_curve", "Medium"),
+        popularity=data.get("popularity", "Medium"),
+        cost=data.get("cost", "Free"),
+        use_cases=data.get("use_cases", []),
+    )
+
+
+def legacy_stack(data: Dict[str, Any]) -> TechStack:
+    return TechStack(
+        name=data.get("name", ""),
+        description=data.get("description", ""),
+        components=[legacy_component(comp) for comp in data.get("components", [])],
+        complexity=data.get("complexity", "Moderate"),
+        time_to_market=data.get("time_to_market", "Medium"),
+        scalability=data.get("scalability", "Medium"),
+        cost_estimate=data.get("cost_estimate", ""),
+        team_size_fit=data.get("team_size_fit", "Small"),
+        best_for=data.get("best_for", []),
+        industries=data.get("industries", []),
+        learning_resources=data.get("learning_resources", []),
+    )
+
+
+def legacy_response(stack: TechStack) -> Dict[str, Any]:
+    # the old TechStackResponse/TechComponent copy, as plain dicts to keep the comparison conservative
+    return {
+        "name": stack.name,
+        "description": stack.description,
+        "components": [
+            {
+                "name": comp.name,
+                "category": comp.category,
+                "description": comp.description,
+                "pros": comp.pros,
+                "cons": comp.cons,
+                "learningCurve": comp.learning_curve,
+                "popularity": comp.popularity,
+                "cost": comp.cost,
+                "useCases": comp.use_cases,
+            }
+            for comp in stack.components
+        ],
+        "complexity": stack.complexity,
+        "timeToMarket": stack.time_to_market,
+        "scalability": stack.scalability,
+        "costEstimate": stack.cost_estimate,
+        "teamSizeFit": stack.team_size_fit,
+        "bestFor": stack.best_for,
+        "industries": stack.industries,
+        "learningResources": stack.learning_resources,
+    }
+
+
+def decode_legacy(events: Events) -> str:
+    stacks, root = [], {}
+    for path, text in events:
+        data = json.loads(text)
+        if len(path) == 4 and path[0] == "recommended_stacks" and path[2] == "components":
+            legacy_component(data)
+        elif len(path) == 2 and path[0] == "recommended_stacks":
+            stacks.append(legacy_stack(data))
+        elif not path:
+            root = data
+    payload = {"stacks": [legacy_response(stack) for stack in stacks], "analysis": root.get("analysis", "")}
+    return json.dumps(payload)
+
+
+def decode_validated(events: Events) -> str:
+    stacks, root = [], "{}"
+    for path, text in events:
+        if len(path) == 4 and path[0] == "recommended_stacks" and path[2] == "components":
+            TechStackComponent.model_validate_json(text)
+        elif len(path) == 2 and path[0] == "recommended_stacks":
+            stacks.append(TechStack.model_validate_json(text))
+        elif not path:
+            root = text
+    analysis = RecommendationSummary.model_validate_json(root).analysis
+    return json.dumps({"stacks": [stack.model_dump(by_alias=True) for stack in stacks], "analysis": analysis})
+
+
+def measure(decode: Callable[[Events], str], events: Events, runs: int) -> Dict[str, float]:
+    decode(events)  # warm up pydantic's validators
+
+    start = time.process_time()
+    for _ in range(runs):
+        decode(events)
+    cpu = (time.process_time() - start) / runs
+
+    # pydantic-core allocates outside the python allocator, so this is the
+    # python-side churn: the intermediate dicts, lists and model copies
+    tracemalloc.start()
+    decode(events)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"cpu_us": cpu * 1e6, "peak_kb": peak / 1024}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recommendation decode cpu/allocation micro-benchmark")
+    parser.add_argument("--runs", type=int, default=500)
+    parser.add_argument("--chunk-size", type=int, default=8, help="characters per streamed chunk")
+    parser.add_argument("--payloads", default=PAYLOADS_DIR, help="directory of recorded responses")
+    args = parser.parse_args()
+
+    text = json.dumps(load_payloads(args.payloads)["recommendations"], indent=2)
+    events = parse_events(text, args.chunk_size)
+    assert json.loads(decode_legacy(events)) == json.loads(decode_validated(events)), "decoders disagree"
+
+    print(f"{'decoder':<12}{'cpu us':>10}{'peak KB':>10}")
+    for name, decode in (("legacy", decode_legacy), ("validated", decode_validated)):
+        row = measure(decode, events, args.runs)
+        print(f"{name:<12}{row['cpu_us']:>10.1f}{row['peak_kb']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# depth_benchmark.py
+#
+# cost and latency of the adaptive pipeline depth on a traffic mix. the
+# queries and their requirements come from payloads/labelled_requirements.jsonl
+# (answered by the fake llm, so each query takes its labelled depth); every
+# query runs once with ADAPTIVE_DEPTH off and once on, with caches off.
+#
+#   python -m benchmarks.depth_benchmark
+#   python -m benchmarks.depth_benchmark --research-mode parallel --llm-latency 0.5
+
+import argparse
+import contextlib
+import io
+import json
+import statistics
+import time
+from collections import Counter
+from typing import Any, Dict, List
+
+from src.depth import DEPTHS
+from src.metrics import LLM_TOKENS
+
+from .fakes import LABELS_PATH, PAYLOADS_DIR, build_fake_workflow, load_labels, load_payloads, recorded_responder
+
+
+def labelled_responder(payloads: Dict[str, Any], rows: List[Dict[str, Any]]):
+    # requirements come from the labels, everything else from the recordings
+    recorded = recorded_responder(payloads)
+    labels = {row["query"]: row for row in rows}
+
+    def respond(messages: List[Any]) -> str:
+        prompt = messages[-1].content
+        row = labels.get(prompt.removeprefix("User Query: ").strip())
+        if prompt.startswith("User Query: ") and row is not None:
+            return json.dumps({field: value for field, value in row.items() if field != "query"})
+        return recorded(messages)
+
+    return respond
+
+
+def tokens() -> float:
+    return sum(
+        LLM_TOKENS.value(step=step, kind=kind)
+        for step in ("analyze_requirements", "generate_recommendations", "write_analysis")
+        for kind in ("prompt", "completion")
+    )
+
+
+def run_mix(args, rows: List[Dict[str, Any]], adaptive: bool) -> Dict[str, Any]:
+    workflow = build_fake_workflow(
+        args.llm_latency, args.search_latency, args.scrape_latency,
+        payloads_dir=args.payloads, research_mode=args.research_mode,
+        responder=labelled_responder(load_payloads(args.payloads), rows),
+    )
+    workflow.adaptive_depth = adaptive
+
+    latencies = []
+    depths = Counter()
+    stacks = 0
+    tokens_before = tokens()
+    for row in rows:
+        start = time.perf_counter()
+        result = workflow.run(row["query"])
+        latencies.append(time.perf_counter() - start)
+        depths[result.pipeline_depth] += 1
+        stacks += len(result.recommended_stacks)
+    firecrawl = workflow.firecrawl.stats()
+    return {
+        "latencies": latencies,
+        "tokens": (tokens() - tokens_before) / len(rows),
+        "firecrawl": (firecrawl.get("search_requests", 0) + firecrawl.get("scrape_requests", 0)) / len(rows),
+        "stacks": stacks / len(rows),
+        "depths": depths,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Adaptive pipeline depth on a traffic mix")
+    parser.add_argument("--labels", default=LABELS_PATH, help="jsonl of queries and their requirements")
+    parser.add_argument("--payloads", default=PAYLOADS_DIR, help="directory of recorded responses")
+    parser.add_argument("--research-mode", choices=["serial", "parallel", "off"], default="serial")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds to first token")
+    parser.add_argument("--search-latency", type=float, default=0.2)
+    parser.add_argument("--scrape-latency", type=float, default=0.3)
+    parser.add_argument("--verbose", action="store_true", help="show workflow logging")
+    args = parser.parse_args()
+
+    rows = load_labels(args.labels)
+    print(f"{'adaptive':<10}{'mean':>9}{'p95':>9}{'tokens':>9}{'firecrawl':>11}{'stacks':>8}  depths")
+    for adaptive in (False, True):
+        # the workflow logs every step; keep the report readable
+        quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with quiet:
+            result = run_mix(args, rows, adaptive)
+        latencies = sorted(result["latencies"])
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        depths = ", ".join(f"{depth} {result['depths'][depth]}" for depth in DEPTHS)
+        print(
+            f"{'on' if adaptive else 'off':<10}{statistics.mean(latencies):>8.2f}s{p95:>8.2f}s"
+            f"{result['tokens']:>9.0f}{result['firecrawl']:>11.1f}{result['stacks']:>8.1f}  {depths}"
+        )
+
+
+if __name__ == "__main__":
+    main()
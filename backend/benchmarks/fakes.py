@@ -0,0 +1,200 @@
+# fakes.py
+#
+# deterministic stand-ins for ChatOpenAI and FirecrawlApp so the workflow can
+# be benchmarked offline. latencies are simulated with sleeps.
+
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from firecrawl.types import Document, DocumentMetadata, SearchData, SearchResultWeb
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+# benchmarks keep every cache in memory and leave no sqlite files behind
+os.environ.setdefault("CACHE_BACKEND", "memory")
+
+PAYLOADS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "payloads")
+# a spread of queries with the requirements the llm gave for each
+LABELS_PATH = os.path.join(PAYLOADS_DIR, "labelled_requirements.jsonl")
+
+
+def load_payloads(directory: str = PAYLOADS_DIR) -> Dict[str, Any]:
+    """Recorded responses: requirements.json, recommendations.json and page.md.
+
+    Swap in a directory of real captured responses to benchmark against
+    production-sized payloads.
+    """
+    with open(os.path.join(directory, "requirements.json")) as f:
+        requirements = json.load(f)
+    with open(os.path.join(directory, "recommendations.json")) as f:
+        recommendations = json.load(f)
+    with open(os.path.join(directory, "page.md")) as f:
+        page = f.read()
+    return {"requirements": requirements, "recommendations": recommendations, "page": page}
+
+
+def load_labels(path: str = LABELS_PATH) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def recorded_responder(payloads: Dict[str, Any]):
+    def respond(messages: List[Any]) -> str:
+        # the output schema is in the system message, the request in the user message
+        prompt = "\n".join(message.content for message in messages)
+        if "Candidate Stacks:" in prompt:
+            return json.dumps({"analysis": payloads["recommendations"]["analysis"]})
+        if "recommended_stacks" in prompt:
+            recommendations = payloads["recommendations"]
+            if "exactly one complete stack" in prompt:
+                # the lean path asks for a single stack
+                recommendations = {**recommendations, "recommended_stacks": recommendations["recommended_stacks"][:1]}
+            return "```json\n" + json.dumps(recommendations, indent=2) + "\n```"
+        return json.dumps(payloads["requirements"], indent=2)
+
+    return respond
+
+
+class FakeChatModel:
+    """Duck-typed ChatOpenAI: invoke/ainvoke/stream/astream with simulated latency.
+
+    first_token_latency is paid before the first chunk, chunk_latency before
+    every following chunk of chunk_size characters. Streams end with a usage
+    chunk like ChatOpenAI(stream_usage=True), at ~4 characters per token.
+    """
+
+    def __init__(
+        self,
+        responder=None,
+        first_token_latency: float = 0.5,
+        chunk_latency: float = 0.002,
+        chunk_size: int = 8,
+    ):
+        self.responder = responder or recorded_responder(load_payloads())
+        self.first_token_latency = first_token_latency
+        self.chunk_latency = chunk_latency
+        self.chunk_size = chunk_size
+        self.calls = 0
+
+    def _chunks(self, messages: List[Any]) -> List[str]:
+        self.calls += 1
+        text = self.responder(messages)
+        return [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+
+    @staticmethod
+    def _usage_chunk(messages: List[Any], chunks: List[str]) -> AIMessageChunk:
+        prompt_tokens = sum(len(message.content) for message in messages) // 4
+        completion_tokens = sum(len(chunk) for chunk in chunks) // 4
+        return AIMessageChunk(content="", usage_metadata={
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        })
+
+    def invoke(self, messages, *args, **kwargs) -> AIMessage:
+        chunks = self._chunks(messages)
+        time.sleep(self.first_token_latency + self.chunk_latency * len(chunks))
+        return AIMessage(content="".join(chunks))
+
+    async def ainvoke(self, messages, *args, **kwargs) -> AIMessage:
+        chunks = self._chunks(messages)
+        await asyncio.sleep(self.first_token_latency + self.chunk_latency * len(chunks))
+        return AIMessage(content="".join(chunks))
+
+    def stream(self, messages, *args, **kwargs):
+        time.sleep(self.first_token_latency)
+        chunks = self._chunks(messages)
+        for index, chunk in enumerate(chunks):
+            if index:
+                time.sleep(self.chunk_latency)
+            yield AIMessageChunk(content=chunk)
+        yield self._usage_chunk(messages, chunks)
+
+    async def astream(self, messages, *args, **kwargs):
+        await asyncio.sleep(self.first_token_latency)
+        chunks = self._chunks(messages)
+        for index, chunk in enumerate(chunks):
+            if index:
+                await asyncio.sleep(self.chunk_latency)
+            yield AIMessageChunk(content=chunk)
+        yield self._usage_chunk(messages, chunks)
+
+
+class FakeFirecrawlApp:
+    """Duck-typed FirecrawlApp returning canned pages after a fixed delay.
+
+    Results have the sdk's v2 shapes: search hits are Documents with their
+    url under metadata (or bare SearchResultWeb links without markdown),
+    scrapes return a Document.
+    """
+
+    def __init__(
+        self,
+        search_latency: float = 0.8,
+        scrape_latency: float = 1.2,
+        with_markdown: bool = True,
+        page: Optional[str] = None,
+    ):
+        self.page = page if page is not None else load_payloads()["page"]
+        self.search_latency = search_latency
+        self.scrape_latency = scrape_latency
+        self.with_markdown = with_markdown
+        self.calls = {"search": 0, "scrape": 0}
+
+    def search(self, query: str, limit: int = 5, **kwargs) -> SearchData:
+        self.calls["search"] += 1
+        time.sleep(self.search_latency)
+        slug = "-".join(query.lower().split()[:6])
+        urls = [f"https://example.com/{slug}/{index}" for index in range(limit)]
+        titles = [f"Result {index} for {query}" for index in range(limit)]
+        if not self.with_markdown:
+            return SearchData(web=[SearchResultWeb(url=url, title=title) for url, title in zip(urls, titles)])
+        return SearchData(web=[
+            Document(markdown=self._page(query), metadata=DocumentMetadata(url=url, source_url=url, title=title))
+            for url, title in zip(urls, titles)
+        ])
+
+    def scrape(self, url: str, **kwargs) -> Document:
+        self.calls["scrape"] += 1
+        time.sleep(self.scrape_latency)
+        return Document(markdown=self._page(url), metadata=DocumentMetadata(url=url, source_url=url))
+
+    def _page(self, topic: str) -> str:
+        return f"# {topic}\n\n{self.page}"
+
+
+def build_fake_workflow(
+    llm_latency: float = 1.0,
+    search_latency: float = 0.8,
+    scrape_latency: float = 1.2,
+    caches: bool = False,
+    payloads_dir: str = PAYLOADS_DIR,
+    research_mode: Optional[str] = None,
+    responder=None,
+):
+    """A Workflow wired to the fakes. Without caches (and the stack catalog) every run pays full latency."""
+    from src.cache import MemoryCache, TieredCache
+    from src.catalog import StackCatalog
+    from src.checkpoints import CheckpointStore
+    from src.firecrawl import FirecrawlService
+    from src.workflow import Workflow
+
+    payloads = load_payloads(payloads_dir)
+    size = 1024 if caches else 0
+    firecrawl = FirecrawlService(
+        app=FakeFirecrawlApp(search_latency=search_latency, scrape_latency=scrape_latency, page=payloads["page"]),
+        cache=TieredCache(MemoryCache(max_entries=size)),
+    )
+    workflow = Workflow(
+        llm=FakeChatModel(responder=responder or recorded_responder(payloads), first_token_latency=llm_latency),
+        firecrawl=firecrawl,
+        research_mode=research_mode,
+        catalog=StackCatalog(":memory:"),
+        recommendation_cache=TieredCache(MemoryCache(max_entries=size)),
+        checkpointer=CheckpointStore(":memory:"),
+    )
+    if not caches:
+        workflow.catalog = None
+    return workflow
@@ -0,0 +1,158 @@
+# harness.py
+#
+# offline load benchmark: drives Workflow.run directly and the FastAPI app
+# through an in-process ASGI client, using the fakes in place of DeepSeek
+# and Firecrawl. reports latency percentiles, throughput and peak RSS for
+# each concurrency level.
+#
+#   python -m benchmarks.harness --target both --concurrency 1,4,16 --requests 32
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+import httpx
+
+from .fakes import PAYLOADS_DIR, build_fake_workflow
+
+
+def percentile(values: List[float], pct: float) -> float:
+    # nearest-rank percentile
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macos bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def summarize(target: str, concurrency: int, latencies: List[float], errors: int, elapsed: float) -> Dict[str, float]:
+    return {
+        "target": target,
+        "concurrency": concurrency,
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "p50": percentile(latencies, 50) if latencies else 0.0,
+        "p95": percentile(latencies, 95) if latencies else 0.0,
+        "p99": percentile(latencies, 99) if latencies else 0.0,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def query_for(index: int, unique: bool) -> str:
+    # unique queries keep the caches and request coalescing from flattering the numbers
+    base = "e-commerce website for small business with mobile-first design"
+    return f"{base} #{index}" if unique else base
+
+
+def bench_workflow(workflow, concurrency: int, requests: int, unique: bool) -> Dict[str, float]:
+    def one(index: int) -> float:
+        start = time.perf_counter()
+        result = workflow.run(query_for(index, unique))
+        if not result.recommended_stacks:
+            raise RuntimeError("workflow returned no stacks")
+        return time.perf_counter() - start
+
+    latencies, errors = [], 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(one, index) for index in range(requests)]:
+            try:
+                latencies.append(future.result())
+            except Exception:
+                errors += 1
+    return summarize("workflow", concurrency, latencies, errors, time.perf_counter() - start)
+
+
+async def bench_api(app, concurrency: int, requests: int, unique: bool) -> Dict[str, float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        async def one(index: int) -> float:
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/api/search", json={"query": query_for(index, unique)})
+                response.raise_for_status()
+                return time.perf_counter() - start
+
+        start = time.perf_counter()
+        outcomes = await asyncio.gather(*(one(index) for index in range(requests)), return_exceptions=True)
+        elapsed = time.perf_counter() - start
+
+    latencies = [outcome for outcome in outcomes if not isinstance(outcome, Exception)]
+    return summarize("api", concurrency, latencies, len(outcomes) - len(latencies), elapsed)
+
+
+def load_app(make_workflow: Callable):
+    # api_server builds its Workflow on first use; it is swapped for the fake
+    # one before any request, and placeholder keys cover anything built anyway
+    os.environ.setdefault("FIRECRAWL_API_KEY", "offline-benchmark")
+    os.environ.setdefault("DEEPSEEK_API_KEY", "offline-benchmark")
+    os.environ.setdefault("FIRECRAWL_CACHE_PATH", "")
+    # every benchmark request comes from one client
+    os.environ.setdefault("RATE_LIMIT_PER_MINUTE", "0")
+    import api_server
+
+    api_server.workflow = make_workflow()
+    api_server.search_flight.memo.clear()
+    return api_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline latency/throughput benchmark")
+    parser.add_argument("--target", choices=["workflow", "api", "both"], default="both")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=32, help="requests per concurrency level")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="seconds to first token")
+    parser.add_argument("--search-latency", type=float, default=0.8)
+    parser.add_argument("--scrape-latency", type=float, default=1.2)
+    parser.add_argument("--research-mode", choices=["serial", "parallel", "off"], default=None)
+    parser.add_argument("--payloads", default=PAYLOADS_DIR, help="directory of recorded responses")
+    parser.add_argument("--caches", action="store_true", help="keep workflow caches enabled")
+    parser.add_argument("--repeat-queries", action="store_true", help="send the same query every time")
+    parser.add_argument("--verbose", action="store_true", help="show workflow logging")
+    args = parser.parse_args()
+
+    def make_workflow():
+        return build_fake_workflow(
+            args.llm_latency, args.search_latency, args.scrape_latency,
+            caches=args.caches, payloads_dir=args.payloads, research_mode=args.research_mode,
+        )
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    unique = not args.repeat_queries
+    rows = []
+
+    for level in levels:
+        # the workflow logs every step; keep the report readable
+        quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with quiet:
+            if args.target in ("workflow", "both"):
+                rows.append(bench_workflow(make_workflow(), level, args.requests, unique))
+            if args.target in ("api", "both"):
+                api_server = load_app(make_workflow)
+                rows.append(asyncio.run(bench_api(api_server.app, level, args.requests, unique)))
+
+    print(f"{'target':<10}{'conc':>6}{'reqs':>6}{'errs':>6}{'p50':>9}{'p95':>9}{'p99':>9}{'req/s':>9}{'rss MB':>9}")
+    for row in rows:
+        print(
+            f"{row['target']:<10}{row['concurrency']:>6}{row['requests']:>6}{row['errors']:>6}"
+            f"{row['p50']:>8.2f}s{row['p95']:>8.2f}s{row['p99']:>8.2f}s"
+            f"{row['throughput']:>9.2f}{row['peak_rss_mb']:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# load_test.py
+#
+# fires concurrent /api/search requests at a running api server and reports
+# whether they overlapped. with a blocking endpoint the requests finish one
+# after another (total ~= sum of latencies); with the async path they
+# overlap (total ~= slowest request) and /api/health stays responsive.
+#
+#   uvicorn api_server:app --port 8000
+#   python benchmarks/load_test.py --concurrency 4
+
+import argparse
+import asyncio
+import time
+
+import httpx
+
+DEFAULT_QUERIES = [
+    "e-commerce website for small business with mobile-first design",
+    "real-time chat application for 100k+ users",
+    "ai-powered analytics dashboard for startup",
+    "simple portfolio website for freelancer",
+]
+
+
+async def timed_request(client: httpx.AsyncClient, method: str, path: str, **kwargs):
+    start = time.perf_counter()
+    response = await client.request(method, path, **kwargs)
+    end = time.perf_counter()
+    return start, end, response.status_code
+
+
+async def run(base_url: str, concurrency: int, timeout: float):
+    queries = [DEFAULT_QUERIES[i % len(DEFAULT_QUERIES)] for i in range(concurrency)]
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout) as client:
+        started = time.perf_counter()
+        searches = [
+            asyncio.create_task(timed_request(client, "POST", "/api/search", json={"query": q}))
+            for q in queries
+        ]
+        # probe health while the searches are in flight
+        await asyncio.sleep(0.5)
+        health = await timed_request(client, "GET", "/api/health")
+        results = await asyncio.gather(*searches)
+        total = time.perf_counter() - started
+
+    latencies = [end - start for start, end, _ in results]
+    overlapping = sum(
+        1 for i, (s1, e1, _) in enumerate(results)
+        for s2, e2, _ in results[i + 1:]
+        if s1 < e2 and s2 < e1
+    )
+    pairs = concurrency * (concurrency - 1) // 2
+
+    print(f"requests:            {concurrency}")
+    print(f"status codes:        {[code for _, _, code in results]}")
+    print(f"wall clock:          {total:.2f}s")
+    print(f"sum of latencies:    {sum(latencies):.2f}s")
+    print(f"slowest request:     {max(latencies):.2f}s")
+    print(f"overlapping pairs:   {overlapping}/{pairs}")
+    print(f"health during load:  {health[1] - health[0]:.3f}s (status {health[2]})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent /api/search load test")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.concurrency, args.timeout))
+
+
+if __name__ == "__main__":
+    main()
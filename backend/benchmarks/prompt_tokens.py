@@ -0,0 +1,79 @@
+# prompt_tokens.py
+#
+# prompt sizes per llm step: tokens the templates take as written versus
+# what PromptBuilder sends after compaction and the step's token budget.
+# the queries come from payloads/labelled_requirements.jsonl and the
+# research context is built from payloads/page.md like a real search.
+#
+#   python -m benchmarks.prompt_tokens
+#   PROMPT_BUDGET_GENERATE_RECOMMENDATIONS=1500 python -m benchmarks.prompt_tokens
+
+import argparse
+from collections import defaultdict
+from typing import Dict, List
+
+from src.context import ResearchContextBuilder, format_snippets
+from src.models import ProjectRequirements, TechStack
+from src.prompting import PromptBuilder, load_tokenizer
+from src.prompts import TechStackPrompts
+
+from .fakes import LABELS_PATH, PAYLOADS_DIR, load_labels, load_payloads
+
+
+def measure(labels_path: str, payloads_dir: str, research_tokens: int) -> Dict[str, List[Dict[str, int]]]:
+    payloads = load_payloads(payloads_dir)
+    stacks = [TechStack.model_validate(stack) for stack in payloads["recommendations"]["recommended_stacks"]]
+    candidates = "\n".join(
+        f"- {stack.name}: {stack.description} ({', '.join(comp.name for comp in stack.components)})"
+        for stack in stacks
+    )
+    context_builder = ResearchContextBuilder(token_budget=research_tokens)
+    builder = PromptBuilder()
+    # every count in the report comes from the same tokenizer
+    load_tokenizer()
+    prompts = TechStackPrompts()
+
+    reports = defaultdict(list)
+    for row in load_labels(labels_path):
+        requirements = ProjectRequirements.model_validate(row)
+        pages = [{"url": f"https://example.com/{topic}", "title": topic, "markdown": f"# {topic}\n\n{payloads['page']}"}
+                 for topic in ("stacks", "comparison", "choices")]
+        research = format_snippets(context_builder.build(pages, requirements))
+        built = {
+            "analyze_requirements": builder.build(
+                "analyze_requirements", prompts.REQUIREMENTS_ANALYSIS_SYSTEM,
+                prompts.requirements_analysis_user(row["query"]),
+            ),
+            "generate_recommendations": builder.build(
+                "generate_recommendations", prompts.STACK_RECOMMENDATION_SYSTEM,
+                prompts.stack_recommendation_user(row["query"], requirements.model_dump_json(), research),
+            ),
+            "write_analysis": builder.build(
+                "write_analysis", prompts.CATALOG_ANALYSIS_SYSTEM,
+                prompts.catalog_analysis_user(row["query"], requirements.model_dump_json(), candidates),
+            ),
+        }
+        for step, prompt in built.items():
+            reports[step].append(prompt.report)
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt tokens per step before and after compaction")
+    parser.add_argument("--labels", default=LABELS_PATH, help="jsonl of queries and their requirements")
+    parser.add_argument("--payloads", default=PAYLOADS_DIR, help="directory of recorded responses")
+    parser.add_argument("--research-tokens", type=int, default=1200, help="research context budget")
+    args = parser.parse_args()
+
+    reports = measure(args.labels, args.payloads, args.research_tokens)
+    print(f"{'step':<26}{'raw':>8}{'sent':>8}{'saved':>8}{'trimmed':>9}")
+    for step, rows in reports.items():
+        sent = sum(row["tokens"] for row in rows) / len(rows)
+        saved = sum(row["saved"] for row in rows) / len(rows)
+        trimmed = sum(row["trimmed"] for row in rows) / len(rows)
+        raw = sent + saved + trimmed
+        print(f"{step:<26}{raw:>8.0f}{sent:>8.0f}{saved / raw:>7.0%} {trimmed / raw:>8.0%}")
+
+
+if __name__ == "__main__":
+    main()
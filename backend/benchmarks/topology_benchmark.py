@@ -0,0 +1,47 @@
+# topology_benchmark.py
+#
+# compares end-to-end latency of the serial, parallel and no-research graph
+# topologies using the offline fakes.
+#
+#   python -m benchmarks.topology_benchmark --runs 5
+
+import argparse
+import contextlib
+import io
+import statistics
+import time
+
+from src.workflow import RESEARCH_MODES
+
+from .fakes import build_fake_workflow
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serial vs parallel graph topology latency")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    parser.add_argument("--search-latency", type=float, default=0.8)
+    parser.add_argument("--scrape-latency", type=float, default=1.2)
+    parser.add_argument("--verbose", action="store_true", help="show workflow logging")
+    args = parser.parse_args()
+
+    workflow = build_fake_workflow(args.llm_latency, args.search_latency, args.scrape_latency)
+    print(f"{'mode':<10}{'mean':>10}{'p50':>10}{'max':>10}")
+    for mode in RESEARCH_MODES:
+        latencies = []
+        # the workflow logs every step; keep the report readable
+        quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with quiet:
+            for run in range(args.runs):
+                start = time.perf_counter()
+                result = workflow.run(f"benchmark query {mode} {run}", research_mode=mode)
+                latencies.append(time.perf_counter() - start)
+                assert result.recommended_stacks, f"{mode} run produced no stacks"
+        print(
+            f"{mode:<10}{statistics.mean(latencies):>9.2f}s"
+            f"{statistics.median(latencies):>9.2f}s{max(latencies):>9.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
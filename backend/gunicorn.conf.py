@@ -0,0 +1,28 @@
+# gunicorn.conf.py
+#
+# multi-worker deployment: gunicorn supervises WEB_CONCURRENCY uvicorn
+# workers. each worker is its own process with its own workflow, pools and
+# memory caches; the recommendation, firecrawl and search caches share a
+# second tier through CACHE_BACKEND (sqlite files by default, or redis).
+#
+#   gunicorn -c gunicorn.conf.py api_server:app
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(multiprocessing.cpu_count(), 4))))
+# the workers split the admission limits between them by this count
+os.environ["WEB_CONCURRENCY"] = str(workers)
+worker_class = "uvicorn_worker.UvicornWorker"
+
+# the app is imported in each worker after the fork, so no client or
+# connection is ever shared between processes
+preload_app = False
+
+# searches stream for a minute or more; don't kill a busy worker
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "180"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+accesslog = "-"
@@ -1,12 +1,57 @@
 # main.py
 
+import argparse
+import os
+import sys
 from dotenv import load_dotenv
 from src.workflow import Workflow
+from src.batch import batch_record, parse_batch_line
 
 load_dotenv()
 
+def run_batch(workflow: Workflow, input_path: str, output_path: str, concurrency: int, research_mode: str):
+    with open(input_path) as f:
+        lines = [line for line in f if line.strip()]
+
+    # workflow steps log to stdout, so results always go to a file
+    with open(output_path, "w") as out:
+        items, positions = [], []
+        for index, line in enumerate(lines):
+            try:
+                items.append(parse_batch_line(line))
+                positions.append(index)
+            except Exception as e:
+                out.write(batch_record(index, None, error=e))
+
+        failed = len(lines) - len(items)
+        results = workflow.batch([item.query for item in items], max_concurrency=concurrency, research_mode=research_mode)
+        for finished, (position, output) in enumerate(results, 1):
+            index, item = positions[position], items[position]
+            if isinstance(output, Exception):
+                failed += 1
+                out.write(batch_record(index, item, error=output))
+            else:
+                out.write(batch_record(index, item, result=output))
+            out.flush()
+            print(f"[{finished}/{len(items)}] {item.query[:60]}", file=sys.stderr)
+
+    print(f"Batch finished: {len(lines) - failed} succeeded, {failed} failed -> {output_path}", file=sys.stderr)
+
 def main():
+    parser = argparse.ArgumentParser(description="Tech stack recommender")
+    parser.add_argument("--batch", metavar="QUERIES.jsonl", help="run queries from a jsonl file instead of prompting")
+    parser.add_argument("--output", help="jsonl output file for --batch (default: <input>.results.jsonl)")
+    parser.add_argument("--concurrency", type=int, default=4, help="queries processed at once in --batch mode")
+    parser.add_argument("--research-mode", choices=["serial", "parallel", "off"], default=None)
+    args = parser.parse_args()
+
     workflow = Workflow()
+
+    if args.batch:
+        output = args.output or f"{os.path.splitext(args.batch)[0]}.results.jsonl"
+        run_batch(workflow, args.batch, output, args.concurrency, args.research_mode)
+        return
+
     print("Developer Tools Research Agent")
 
     while True:
@@ -0,0 +1,196 @@
+# admission.py
+
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from .metrics import ADMISSION_DECISIONS, ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_WAIT
+
+# admission control in front of the workflow: every run costs paid deepseek
+# and firecrawl calls, so a spike waits in a short queue or is turned away
+# quickly instead of piling onto the upstream apis.
+#
+#   per-client token bucket -> 429 when a client is over its rate
+#   concurrency cap         -> at most max_concurrency slots of runs at once
+#   bounded priority queue  -> 503 when full or when a wait passes its deadline
+
+# lower runs first
+INTERACTIVE = 0
+BATCH = 1
+
+
+class Rejected(Exception):
+    """Turned away by admission control; the api answers status_code with Retry-After"""
+
+    def __init__(self, status_code: int, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBuckets:
+    """Per-client token buckets: rate tokens a second, up to burst saved up"""
+
+    def __init__(self, rate: float, burst: float, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def take(self, client: str, cost: float = 1) -> float:
+        """0 when admitted, otherwise seconds until the client has enough tokens"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        cost = min(cost, self.burst)
+        wait = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            wait = (cost - tokens) / self.rate
+        self._buckets[client] = (tokens, now)
+        self._buckets.move_to_end(client)
+        # the least recently seen clients are forgotten (a full bucket again)
+        while len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class AdmissionController:
+    """Concurrency cap, bounded priority queue and per-client rate limits.
+
+    A run takes `weight` slots (one for a search or each query of a batch).
+    When the slots are busy it waits in a queue ordered by priority, then
+    arrival; the queue holds at most max_queue waiters and each gives up
+    after queue_timeout seconds. Slots are handed to waiters in order, so a
+    heavy waiter at the head isn't starved by lighter ones behind it.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        max_queue: int = 32,
+        queue_timeout: float = 10,
+        rate: float = 0.5,
+        burst: float = 10,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        # a rate of 0 turns per-client limits off
+        self.buckets = TokenBuckets(rate, burst) if rate > 0 else None
+        self.in_flight = 0
+        self._queue: List[Tuple[int, int, int, asyncio.Future]] = []
+        self._order = itertools.count()
+        self._stats = Counter()
+        # moving average of how long a slot is held, for Retry-After
+        self._hold_time = 10.0
+
+    def check_rate(self, client: str, cost: float = 1):
+        if self.buckets is None:
+            return
+        wait = self.buckets.take(client, cost)
+        if wait:
+            self._reject("rate_limited")
+            raise Rejected(429, "Too many requests from this client", wait)
+
+    def check_queue(self):
+        """Turn a run away now when the queue is already full, before any slot is taken"""
+        if len(self._queue) >= self.max_queue:
+            self._reject("queue_full")
+            raise Rejected(503, "Server is at capacity, try again shortly", self._retry_after())
+
+    @asynccontextmanager
+    async def slot(self, priority: int = INTERACTIVE, weight: int = 1) -> AsyncIterator[None]:
+        """Hold `weight` slots for the duration of the block, queueing if needed"""
+        await self.acquire(priority, weight)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(weight, time.monotonic() - start)
+
+    async def acquire(self, priority: int = INTERACTIVE, weight: int = 1) -> int:
+        """Take slots, waiting in the queue if needed; returns the weight to release"""
+        weight = max(1, min(weight, self.max_concurrency))
+        if not self._queue and self.in_flight + weight <= self.max_concurrency:
+            self.in_flight += weight
+            self._count("admitted", priority, wait=0.0)
+            return weight
+
+        self.check_queue()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._order), weight, future))
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not future.done():
+                future.cancel()
+                self._forget(future)
+                self._reject("queue_timeout")
+                raise Rejected(503, "Timed out waiting for capacity, try again shortly", self._retry_after())
+        except asyncio.CancelledError:
+            # the slots may have been handed over just as the caller went away
+            if future.done() and not future.cancelled():
+                self.release(weight)
+            else:
+                future.cancel()
+                self._forget(future)
+            raise
+        self._count("queued", priority, wait=time.monotonic() - start)
+        return weight
+
+    def release(self, weight: int = 1, held: Optional[float] = None):
+        self.in_flight -= max(1, min(weight, self.max_concurrency))
+        if held is not None:
+            self._hold_time = 0.9 * self._hold_time + 0.1 * held
+        # hand free slots to waiters in order
+        while self._queue:
+            _, _, needed, future = self._queue[0]
+            if future.done():
+                heapq.heappop(self._queue)
+                continue
+            if self.in_flight + needed > self.max_concurrency:
+                break
+            heapq.heappop(self._queue)
+            self.in_flight += needed
+            future.set_result(True)
+
+    def queue_depth(self) -> int:
+        return sum(1 for *_, future in self._queue if not future.done())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth(),
+            "max_concurrency": self.max_concurrency,
+        }
+
+    def _forget(self, future: asyncio.Future):
+        self._queue = [entry for entry in self._queue if entry[3] is not future]
+        heapq.heapify(self._queue)
+
+    def _retry_after(self) -> float:
+        # time for the slots to turn over once per queued run ahead
+        return self._hold_time * (self.queue_depth() + 1) / self.max_concurrency
+
+    def _count(self, outcome: str, priority: int, wait: float):
+        self._stats[outcome] += 1
+        ADMISSION_DECISIONS.inc(outcome=outcome)
+        ADMISSION_WAIT.observe(wait, priority="batch" if priority >= BATCH else "interactive")
+
+    def _reject(self, outcome: str):
+        self._stats[outcome] += 1
+        ADMISSION_DECISIONS.inc(outcome=outcome)
+
+
+def register_metrics(controller: AdmissionController):
+    ADMISSION_QUEUE_DEPTH.set_function(lambda: {(): controller.queue_depth()})
+    ADMISSION_IN_FLIGHT.set_function(lambda: {(): controller.in_flight})
@@ -0,0 +1,46 @@
+# batch.py
+
+import json
+from typing import Any, Callable, Dict, Optional
+from pydantic import BaseModel
+from .models import StackRecommendationState
+
+# jsonl input/output shared by the /api/search/batch endpoint and main.py --batch.
+# input lines are {"query": "...", "id": "optional caller id"} or a bare json string.
+
+
+class BatchItem(BaseModel):
+    query: str
+    id: Optional[str] = None
+
+
+def parse_batch_line(line: str) -> BatchItem:
+    data = json.loads(line)
+    item = BatchItem(query=data) if isinstance(data, str) else BatchItem(**data)
+    if not item.query.strip():
+        raise ValueError("Query cannot be empty")
+    return item
+
+
+def batch_record(
+    index: int,
+    item: Optional[BatchItem],
+    result: Optional[StackRecommendationState] = None,
+    error: Optional[Exception] = None,
+    serialize: Optional[Callable[[StackRecommendationState], Dict[str, Any]]] = None,
+) -> str:
+    """One jsonl output line; every input line gets exactly one, in completion order"""
+    record: Dict[str, Any] = {
+        "index": index,
+        "id": item.id if item else None,
+        "query": item.query if item else None,
+    }
+    if error is not None:
+        record["status"] = "error"
+        record["error"] = f"{type(error).__name__}: {error}"
+    else:
+        record["status"] = "ok"
+        record["result"] = serialize(result) if serialize else result.model_dump(
+            include={"project_requirements", "recommended_stacks", "analysis"}
+        )
+    return json.dumps(record) + "\n"
@@ -0,0 +1,387 @@
+# cache.py
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Dict, Optional, Union
+
+# small ttl caches shared by the firecrawl service and the workflow.
+# values must be json serializable so they can live in the disk tier.
+#
+# with several worker processes the second tier is what they share:
+# CACHE_BACKEND=sqlite (default, one file per cache on the local disk) or
+# redis (any redis-compatible server at REDIS_URL, for several hosts).
+# memory keeps every cache inside its own process.
+
+
+class MemoryCache:
+    """In-process LRU cache with a per-entry TTL"""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = Counter()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        with self._lock:
+            self._entries[key] = (value, time.time() + (ttl or self.ttl))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return with_hit_rate(dict(self._stats), size=len(self._entries))
+
+
+def connect_sqlite(path: str) -> sqlite3.Connection:
+    """Connection shared by a store's threads, in WAL mode so worker processes read while one writes"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+class SQLiteStore:
+    """Base for the sqlite-backed stores: one connection behind a lock, stats and periodic pruning"""
+
+    # expired rows and overflow are pruned every N writes rather than on each one
+    PRUNE_EVERY = 100
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stats = Counter()
+        self._writes = 0
+        self._conn = connect_sqlite(path)
+
+    def _prune_due(self) -> bool:
+        # called under the lock after each write
+        self._writes += 1
+        return self._writes % self.PRUNE_EVERY == 0
+
+
+class SQLiteCache(SQLiteStore):
+    """On-disk cache in a single SQLite table, survives restarts"""
+
+    def __init__(self, path: str, max_entries: int = 10000, ttl: float = 86400):
+        super().__init__(path)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_created ON cache (created_at)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+
+            value, expires_at = row
+            if expires_at <= time.time():
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+
+            self._stats["hits"] += 1
+            return json.loads(value)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        now = time.time()
+        payload = json.dumps(value, default=str)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, created_at) VALUES (?, ?, ?, ?)",
+                (key, payload, now + (ttl or self.ttl), now),
+            )
+            if self._prune_due():
+                self._prune(now)
+            self._conn.commit()
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """Set only if the key is missing or expired; True when this call set it"""
+        now = time.time()
+        payload = json.dumps(value, default=str)
+        with self._lock:
+            added = self._conn.execute(
+                "INSERT INTO cache (key, value, expires_at, created_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET value = excluded.value,"
+                " expires_at = excluded.expires_at, created_at = excluded.created_at"
+                " WHERE cache.expires_at <= ?",
+                (key, payload, now + (ttl or self.ttl), now, now),
+            ).rowcount
+            self._conn.commit()
+        return added == 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def delete_if(self, key: str, value: Any) -> bool:
+        """Delete only while the key still holds value; True when this call deleted it"""
+        payload = json.dumps(value, default=str)
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM cache WHERE key = ? AND value = ?", (key, payload)
+            ).rowcount
+            self._conn.commit()
+        return deleted == 1
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        size = len(self)
+        with self._lock:
+            return with_hit_rate(dict(self._stats), size=size)
+
+    def _prune(self, now: float):
+        expired = self._conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,)).rowcount
+        overflow = self._conn.execute(
+            "DELETE FROM cache WHERE key IN ("
+            " SELECT key FROM cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+        self._stats["expired"] += expired
+        self._stats["evictions"] += overflow
+
+
+# compare and delete in one step, so a lock that expired and was taken by
+# another worker isn't released by its previous owner
+DELETE_IF = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class RedisCache:
+    """Cache in a redis-compatible server, shared by every worker and host.
+
+    Entries expire through redis itself; max_entries is left to the
+    server's maxmemory policy. Needs the optional redis package.
+    """
+
+    def __init__(self, url: str, namespace: str, ttl: float = 3600, client: Optional[Any] = None):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise ImportError("CACHE_BACKEND=redis needs the redis package: pip install redis")
+            # connects on the first command, not here
+            client = redis.Redis.from_url(url)
+        self._client = client
+        self.prefix = f"codecompass:{namespace}:"
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._stats = Counter()
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self._client.get(self.prefix + key)
+        with self._lock:
+            self._stats["misses" if value is None else "hits"] += 1
+        return None if value is None else json.loads(value)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self._client.set(self.prefix + key, json.dumps(value, default=str), px=int((ttl or self.ttl) * 1000))
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """Set only if the key is missing; True when this call set it"""
+        return bool(self._client.set(
+            self.prefix + key, json.dumps(value, default=str), px=int((ttl or self.ttl) * 1000), nx=True
+        ))
+
+    def delete(self, key: str):
+        self._client.delete(self.prefix + key)
+
+    def delete_if(self, key: str, value: Any) -> bool:
+        """Delete only while the key still holds value; True when this call deleted it"""
+        return bool(self._client.eval(DELETE_IF, 1, self.prefix + key, json.dumps(value, default=str)))
+
+    def clear(self):
+        keys = list(self._client.scan_iter(match=self.prefix + "*", count=500))
+        for start in range(0, len(keys), 500):
+            self._client.delete(*keys[start:start + 500])
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self._client.scan_iter(match=self.prefix + "*", count=500))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return with_hit_rate(dict(self._stats))
+
+
+SharedCache = Union[SQLiteCache, RedisCache]
+
+
+def shared_cache(namespace: str, max_entries: int, ttl: float, path: Optional[str] = None) -> Optional[SharedCache]:
+    """The cross-process tier for a cache, picked by CACHE_BACKEND; None for memory only.
+
+    sqlite uses path, or CACHE_DIR/<namespace>.sqlite; an empty path turns it off.
+    """
+    backend = os.getenv("CACHE_BACKEND", "sqlite")
+    if backend == "redis":
+        return RedisCache(os.getenv("REDIS_URL", "redis://localhost:6379/0"), namespace, ttl=ttl)
+    if backend == "sqlite":
+        if path is None:
+            path = os.path.join(os.getenv("CACHE_DIR", ".cache"), f"{namespace}.sqlite")
+        return SQLiteCache(path, max_entries=max_entries, ttl=ttl) if path else None
+    if backend != "memory":
+        raise ValueError(f"Unknown cache backend: {backend}")
+    return None
+
+
+class TieredCache:
+    """Memory tier in front of an optional disk (or other shared) tier.
+
+    Disk hits are promoted into memory so repeated lookups stay in-process.
+    The shared tier fails open: when it errors (a locked file, redis gone)
+    the error is logged and counted and the memory tier carries on alone.
+    Given open_disk instead of disk, the shared tier is opened on first
+    use, so building a cache creates no files or connections.
+    """
+
+    def __init__(
+        self,
+        memory: MemoryCache,
+        disk: Optional[SharedCache] = None,
+        open_disk: Optional[Callable[[], Optional[SharedCache]]] = None,
+    ):
+        self.memory = memory
+        self._disk_tier = disk
+        self._open_disk = open_disk
+        self._stats = Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def disk(self) -> Optional[SharedCache]:
+        with self._lock:
+            if self._open_disk is not None:
+                open_disk, self._open_disk = self._open_disk, None
+                try:
+                    self._disk_tier = open_disk()
+                except Exception as e:
+                    print(f"Shared cache unavailable, using memory only: {e}")
+            return self._disk_tier
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("hits")
+            return value
+
+        value = self._disk("get", key)
+        if value is not None:
+            self.memory.set(key, value)
+            self._count("hits")
+            return value
+
+        self._count("misses")
+        return None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self.memory.set(key, value, ttl)
+        self._disk("set", key, value, ttl)
+
+    def delete(self, key: str):
+        self.memory.delete(key)
+        self._disk("delete", key)
+
+    def clear(self):
+        self.memory.clear()
+        self._disk("clear")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = with_hit_rate(dict(self._stats))
+        stats["memory"] = self.memory.stats()
+        if self._disk_tier is not None:
+            stats["disk"] = self._disk_tier.stats()
+        return stats
+
+    def _disk(self, operation: str, *args) -> Any:
+        disk = self.disk
+        if disk is None:
+            return None
+        try:
+            return getattr(disk, operation)(*args)
+        except Exception as e:
+            self._count("disk_errors")
+            print(f"Shared cache {operation} failed, using memory only: {e}")
+            return None
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+
+def with_hit_rate(stats: Dict[str, Any], **extra) -> Dict[str, Any]:
+    """Stats with hits, misses and hit_rate filled in, plus any extra fields"""
+    stats.setdefault("hits", 0)
+    stats.setdefault("misses", 0)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+    stats.update(extra)
+    return stats
+
+
+def normalize_key(text: str) -> str:
+    """Lowercase and collapse whitespace so trivially different keys match"""
+    return " ".join(text.lower().split())
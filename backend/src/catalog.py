@@ -0,0 +1,195 @@
+# catalog.py
+
+import hashlib
+import json
+import time
+from typing import Any, Dict, List, Optional
+from .cache import SQLiteStore, with_hit_rate
+from .models import ProjectRequirements, TechStack
+
+# how much each requirement attribute counts toward a profile match;
+# project_type must match exactly and isn't weighted
+ATTRIBUTE_WEIGHTS = {
+    "scale": 2.0,
+    "budget": 1.5,
+    "team_experience": 1.5,
+    "performance_needs": 1.5,
+    "timeline": 1.0,
+}
+# weight of the special requirements, scaled by the share the stack covers
+TAG_WEIGHT = 2.0
+
+
+def stack_fingerprint(stack: TechStack) -> str:
+    """Same stack name and component set means the same catalog entry"""
+    names = sorted(component.name.strip().lower() for component in stack.components)
+    payload = json.dumps([stack.name.strip().lower(), names])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def normalize_tag(tag: str) -> str:
+    return " ".join(tag.lower().replace("-", " ").split())
+
+
+class StackCatalog(SQLiteStore):
+    """Persistent catalog of generated stacks, indexed by requirement profile.
+
+    Every complete generation adds its stacks along with the requirements
+    they were recommended for (one profile row per stack and distinct
+    requirement profile) and the special requirements as tags. lookup()
+    scores the stored profiles of the same project type against new
+    requirements and answers when enough distinct stacks are close enough.
+    """
+
+    # overflow is pruned every N additions rather than on each one
+    PRUNE_EVERY = 50
+
+    def __init__(
+        self,
+        path: str,
+        min_stacks: int = 2,
+        min_similarity: float = 0.8,
+        max_stacks: int = 5000,
+    ):
+        super().__init__(path)
+        self.min_stacks = min_stacks
+        self.min_similarity = min_similarity
+        self.max_stacks = max_stacks
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS stacks ("
+            " id INTEGER PRIMARY KEY,"
+            " fingerprint TEXT UNIQUE NOT NULL,"
+            " data TEXT NOT NULL,"
+            " uses INTEGER NOT NULL DEFAULT 0,"
+            " updated_at REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS stack_profiles ("
+            " stack_id INTEGER NOT NULL REFERENCES stacks (id) ON DELETE CASCADE,"
+            " project_type TEXT NOT NULL,"
+            " scale TEXT NOT NULL,"
+            " budget TEXT NOT NULL,"
+            " timeline TEXT NOT NULL,"
+            " team_experience TEXT NOT NULL,"
+            " performance_needs TEXT NOT NULL,"
+            " UNIQUE (stack_id, project_type, scale, budget, timeline, team_experience, performance_needs));"
+            "CREATE INDEX IF NOT EXISTS profiles_type_scale ON stack_profiles (project_type, scale);"
+            "CREATE TABLE IF NOT EXISTS stack_tags ("
+            " stack_id INTEGER NOT NULL REFERENCES stacks (id) ON DELETE CASCADE,"
+            " tag TEXT NOT NULL,"
+            " PRIMARY KEY (stack_id, tag));"
+            "CREATE INDEX IF NOT EXISTS tags_tag ON stack_tags (tag);"
+            "CREATE INDEX IF NOT EXISTS stacks_updated ON stacks (updated_at);"
+        )
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.commit()
+
+    def add(self, requirements: ProjectRequirements, stacks: List[TechStack]):
+        """Record generated stacks under the requirements they were written for"""
+        now = time.time()
+        tags = {normalize_tag(tag) for tag in requirements.special_requirements if tag.strip()}
+        with self._lock:
+            for stack in stacks:
+                # the newest write-up of a stack replaces the older one
+                self._conn.execute(
+                    "INSERT INTO stacks (fingerprint, data, updated_at) VALUES (?, ?, ?)"
+                    " ON CONFLICT (fingerprint) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                    (stack_fingerprint(stack), stack.model_dump_json(), now),
+                )
+                stack_id = self._conn.execute(
+                    "SELECT id FROM stacks WHERE fingerprint = ?", (stack_fingerprint(stack),)
+                ).fetchone()[0]
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO stack_profiles"
+                    " (stack_id, project_type, scale, budget, timeline, team_experience, performance_needs)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        stack_id, requirements.project_type, requirements.scale, requirements.budget,
+                        requirements.timeline, requirements.team_experience, requirements.performance_needs,
+                    ),
+                )
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO stack_tags (stack_id, tag) VALUES (?, ?)",
+                    [(stack_id, tag) for tag in tags],
+                )
+            self._stats["additions"] += len(stacks)
+            if self._prune_due():
+                self._prune()
+            self._conn.commit()
+
+    def lookup(self, requirements: ProjectRequirements, limit: int = 3) -> Optional[List[TechStack]]:
+        """Best matching stacks when the profile is well covered, otherwise None"""
+        # profiles and tags are scored on their own; stack json is only read for the winners
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT p.stack_id, s.uses, p.scale, p.budget, p.timeline, p.team_experience, p.performance_needs"
+                " FROM stack_profiles p JOIN stacks s ON s.id = p.stack_id"
+                " WHERE p.project_type = ?",
+                (requirements.project_type,),
+            ).fetchall()
+            tags: Dict[int, set] = {}
+            wanted = {normalize_tag(tag) for tag in requirements.special_requirements if tag.strip()}
+            if rows and wanted:
+                placeholders = ",".join("?" * len(wanted))
+                for stack_id, tag in self._conn.execute(
+                    "SELECT t.stack_id, t.tag FROM stack_tags t JOIN stack_profiles p ON p.stack_id = t.stack_id"
+                    f" WHERE p.project_type = ? AND t.tag IN ({placeholders})",
+                    (requirements.project_type, *sorted(wanted)),
+                ):
+                    tags.setdefault(stack_id, set()).add(tag)
+
+        # a stack's score is its best matching profile
+        best: Dict[int, tuple] = {}
+        for stack_id, uses, *profile in rows:
+            similarity = self._similarity(requirements, profile, wanted, tags.get(stack_id, set()))
+            if similarity > best.get(stack_id, (-1.0,))[0]:
+                best[stack_id] = (similarity, uses)
+        matches = sorted(
+            ((similarity, uses, stack_id) for stack_id, (similarity, uses) in best.items()
+             if similarity >= self.min_similarity),
+            reverse=True,
+        )[:limit]
+
+        with self._lock:
+            if len(matches) < self.min_stacks:
+                self._stats["misses"] += 1
+                return None
+            stack_ids = [stack_id for _, _, stack_id in matches]
+            placeholders = ",".join("?" * len(stack_ids))
+            data = dict(self._conn.execute(
+                f"SELECT id, data FROM stacks WHERE id IN ({placeholders})", stack_ids
+            ).fetchall())
+            self._conn.executemany("UPDATE stacks SET uses = uses + 1 WHERE id = ?", [(i,) for i in stack_ids])
+            self._conn.commit()
+            self._stats["hits"] += 1
+        # a stack pruned since scoring is simply left out
+        return [TechStack.model_validate_json(data[stack_id]) for stack_id in stack_ids if stack_id in data]
+
+    @staticmethod
+    def _similarity(requirements: ProjectRequirements, profile: List[str], wanted: set, tags: set) -> float:
+        stored = dict(zip(("scale", "budget", "timeline", "team_experience", "performance_needs"), profile))
+        score = sum(
+            weight for attribute, weight in ATTRIBUTE_WEIGHTS.items()
+            if stored[attribute] == getattr(requirements, attribute)
+        )
+        total = sum(ATTRIBUTE_WEIGHTS.values())
+        if wanted:
+            score += TAG_WEIGHT * len(wanted & tags) / len(wanted)
+            total += TAG_WEIGHT
+        return score / total
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM stacks").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        size = len(self)
+        with self._lock:
+            return with_hit_rate(dict(self._stats), size=size)
+
+    def _prune(self):
+        # least recently written stacks go first; profiles and tags cascade
+        overflow = self._conn.execute(
+            "DELETE FROM stacks WHERE id IN ("
+            " SELECT id FROM stacks ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_stacks,),
+        ).rowcount
+        self._stats["evictions"] += overflow
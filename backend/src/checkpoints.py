@@ -0,0 +1,144 @@
+# checkpoints.py
+
+import asyncio
+import time
+from collections import Counter
+from typing import Any, AsyncIterator, Dict, Optional, Sequence, Tuple
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import ChannelVersions, Checkpoint, CheckpointMetadata, CheckpointTuple
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite import SqliteSaver
+from .cache import connect_sqlite
+from .models import ProjectRequirements, ResearchSnippet, StackRecommendationState, TechStack, TechStackComponent
+
+# the state models saved in checkpoints; anything else is refused on load
+CHECKPOINT_TYPES = (StackRecommendationState, ProjectRequirements, TechStack, TechStackComponent, ResearchSnippet)
+
+
+class CheckpointStore(SqliteSaver):
+    """SQLite checkpointer for the workflow graphs, with thread garbage collection.
+
+    Every graph node's output is saved under the run's thread id, so a
+    failed or interrupted run can pick up after its last finished node.
+    The async methods run the sync ones in a worker thread: one connection
+    serves invoke (cli) and ainvoke (api server) alike, and sqlite calls
+    are short enough that a thread hop beats a second driver.
+
+    A thread_activity table tracks when each thread last saved a
+    checkpoint; threads idle longer than ttl, and the oldest beyond
+    max_threads, are deleted every PRUNE_EVERY checkpoints.
+    """
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, path: str, ttl: float = 86400, max_threads: int = 10000):
+        super().__init__(
+            connect_sqlite(path),
+            serde=JsonPlusSerializer(
+                allowed_msgpack_modules=[(model.__module__, model.__name__) for model in CHECKPOINT_TYPES]
+            ),
+        )
+        self.path = path
+        self.ttl = ttl
+        self.max_threads = max_threads
+        self._stats = Counter()
+        self._writes = 0
+
+    def setup(self) -> None:
+        if self.is_setup:
+            return
+        super().setup()
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS thread_activity ("
+            " thread_id TEXT PRIMARY KEY,"
+            " updated_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS thread_activity_updated ON thread_activity (updated_at);"
+        )
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        saved = super().put(config, checkpoint, metadata, new_versions)
+        with self.cursor() as cur:
+            cur.execute(
+                "INSERT INTO thread_activity (thread_id, updated_at) VALUES (?, ?)"
+                " ON CONFLICT (thread_id) DO UPDATE SET updated_at = excluded.updated_at",
+                (str(config["configurable"]["thread_id"]), time.time()),
+            )
+            self._stats["checkpoints"] += 1
+            self._writes += 1
+            prune = self._writes % self.PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+        return saved
+
+    def delete_thread(self, thread_id: str) -> None:
+        super().delete_thread(thread_id)
+        with self.cursor() as cur:
+            cur.execute("DELETE FROM thread_activity WHERE thread_id = ?", (str(thread_id),))
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """Delete expired and overflow threads; returns how many went"""
+        now = now or time.time()
+        with self.cursor(transaction=False) as cur:
+            expired = [row[0] for row in cur.execute(
+                "SELECT thread_id FROM thread_activity WHERE updated_at <= ?", (now - self.ttl,)
+            )]
+            overflow = [row[0] for row in cur.execute(
+                "SELECT thread_id FROM thread_activity WHERE updated_at > ?"
+                " ORDER BY updated_at DESC LIMIT -1 OFFSET ?",
+                (now - self.ttl, self.max_threads),
+            )]
+        for thread_id in expired + overflow:
+            self.delete_thread(thread_id)
+        with self.lock:
+            self._stats["expired"] += len(expired)
+            self._stats["evictions"] += len(overflow)
+        return len(expired) + len(overflow)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.cursor(transaction=False) as cur:
+            threads = cur.execute("SELECT COUNT(*) FROM thread_activity").fetchone()[0]
+            return {**self._stats, "threads": threads}
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        checkpoints = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for checkpoint in checkpoints:
+            yield checkpoint
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
@@ -0,0 +1,214 @@
+# clients.py
+
+import os
+import asyncio
+import importlib
+import importlib.util
+import threading
+from typing import Dict, Optional, Tuple, Union
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from .metrics import HTTP_POOL_CONNECTIONS, HTTP_POOL_SATURATION
+
+# process-wide pooled http clients, so concurrent requests reuse warm
+# keep-alive connections instead of paying a tls handshake each time.
+#
+#   llm       - httpx clients handed to ChatOpenAI (sync and async)
+#   firecrawl - a requests session the firecrawl sdk is routed through
+
+_lock = threading.Lock()
+_llm_clients: Optional[Tuple[httpx.Client, httpx.AsyncClient]] = None
+_firecrawl_session: Optional[requests.Session] = None
+_firecrawl_pool_size = 0
+
+
+def _reset_after_fork():
+    # a forked worker must not share its parent's sockets; it opens its own
+    global _lock, _llm_clients, _firecrawl_session
+    _lock = threading.Lock()
+    _llm_clients = None
+    _firecrawl_session = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def http2_enabled() -> bool:
+    # httpx only speaks http/2 with the optional h2 package installed
+    return os.getenv("HTTP2", "1") == "1" and importlib.util.find_spec("h2") is not None
+
+
+def _llm_limits() -> httpx.Limits:
+    pool_size = int(os.getenv("LLM_POOL_SIZE", "20"))
+    return httpx.Limits(
+        max_connections=pool_size,
+        max_keepalive_connections=int(os.getenv("LLM_POOL_KEEPALIVE", str(pool_size))),
+        keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60")),
+    )
+
+
+def llm_http_clients() -> Tuple[httpx.Client, httpx.AsyncClient]:
+    """Shared (sync, async) httpx clients for the DeepSeek API"""
+    global _llm_clients
+    with _lock:
+        if _llm_clients is None or _llm_clients[0].is_closed or _llm_clients[1].is_closed:
+            limits = _llm_limits()
+            http2 = http2_enabled()
+            _llm_clients = (
+                httpx.Client(limits=limits, http2=http2),
+                httpx.AsyncClient(limits=limits, http2=http2),
+            )
+        return _llm_clients
+
+
+class _SessionRequests:
+    """Stands in for the requests module inside the firecrawl sdk.
+
+    The sdk has no way to pass in a session and calls requests.post/get/...
+    directly, which opens a fresh connection every time; every http verb goes
+    through the shared session here and everything else (exceptions,
+    Response) falls through to requests.
+    """
+
+    _verbs = ("request", "get", "head", "options", "post", "put", "patch", "delete")
+
+    def __init__(self, session: requests.Session):
+        self._session = session
+
+    def __getattr__(self, name):
+        if name in self._verbs:
+            return getattr(self._session, name)
+        return getattr(requests, name)
+
+
+def firecrawl_session() -> requests.Session:
+    """Shared keep-alive session for the Firecrawl API, installed into the sdk"""
+    global _firecrawl_session, _firecrawl_pool_size
+    with _lock:
+        if _firecrawl_session is None:
+            pool_size = int(os.getenv("FIRECRAWL_POOL_SIZE", os.getenv("FIRECRAWL_MAX_CONCURRENCY", "4")))
+            session = requests.Session()
+            # size the per-host pool to the firecrawl worker threads so every
+            # worker keeps its connection alive between calls
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _install_session(session)
+            _firecrawl_session, _firecrawl_pool_size = session, pool_size
+        return _firecrawl_session
+
+
+def _install_session(session: requests.Session):
+    # the sdk modules that import requests at module level; requirements.txt
+    # pins firecrawl-py to the 4.x line this layout was checked against
+    targets = ("firecrawl.v2.utils.http_client", "firecrawl.v1.client")
+    installed = 0
+    for name in targets:
+        try:
+            module = importlib.import_module(name)
+        except ImportError:
+            continue
+        # a forked worker replaces the shim its parent installed
+        current = getattr(module, "requests", None)
+        if current is requests or isinstance(current, _SessionRequests):
+            module.requests = _SessionRequests(session)
+            installed += 1
+    if not installed:
+        print("Firecrawl sdk layout not recognised, its calls will not use the pooled session")
+
+
+async def warm_up(llm_url: str = "https://api.deepseek.com", firecrawl_url: str = "https://api.firecrawl.dev"):
+    """Open a connection to each API ahead of the first request"""
+    timeout = float(os.getenv("HTTP_WARMUP_TIMEOUT", "3"))
+    _, async_client = llm_http_clients()
+    session = firecrawl_session()
+
+    async def touch_llm():
+        await async_client.head(llm_url, timeout=timeout)
+
+    def touch_firecrawl():
+        session.head(firecrawl_url, timeout=timeout)
+
+    results = await asyncio.gather(touch_llm(), asyncio.to_thread(touch_firecrawl), return_exceptions=True)
+    for name, result in zip(("deepseek", "firecrawl"), results):
+        if isinstance(result, Exception):
+            print(f"Connection warm-up for {name} failed: {result}")
+
+
+async def close_clients():
+    """Close the shared clients when the process shuts down"""
+    global _llm_clients, _firecrawl_session
+    with _lock:
+        llm_clients, _llm_clients = _llm_clients, None
+        session, _firecrawl_session = _firecrawl_session, None
+    if llm_clients is not None:
+        llm_clients[0].close()
+        await llm_clients[1].aclose()
+    if session is not None:
+        session.close()
+
+
+def _httpx_pool_usage(client: Union[httpx.Client, httpx.AsyncClient]) -> Tuple[int, int, int]:
+    # (in use, idle, queued) read from httpcore's pool; httpx has no public
+    # pool stats, so anything missing after an upgrade reads as zero
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    connections = list(getattr(pool, "connections", None) or [])
+    in_use = sum(1 for connection in connections if not connection.is_idle())
+    queued = sum(1 for request in list(getattr(pool, "_requests", None) or []) if request.is_queued())
+    return in_use, len(connections) - in_use, queued
+
+
+def _urllib3_pool_usage(adapter: HTTPAdapter) -> Tuple[int, int]:
+    # (in use, idle) across the adapter's per-host pools
+    in_use = idle = 0
+    pools = getattr(getattr(adapter, "poolmanager", None), "pools", None)
+    for key in list(pools.keys()) if pools is not None else []:
+        queue = getattr(pools.get(key), "pool", None)
+        if queue is None:
+            continue
+        # the queue holds idle connections plus empty slots (None)
+        in_use += queue.maxsize - queue.qsize()
+        idle += sum(1 for connection in list(queue.queue) if connection is not None)
+    return in_use, idle
+
+
+def pool_usage() -> Dict[str, Dict[str, int]]:
+    """Connections in use and idle (plus queued requests for httpx) per shared pool"""
+    usage = {}
+    llm_clients, session = _llm_clients, _firecrawl_session
+
+    if llm_clients is not None:
+        totals = [0, 0, 0]
+        for client in llm_clients:
+            if not client.is_closed:
+                totals = [a + b for a, b in zip(totals, _httpx_pool_usage(client))]
+        usage["llm"] = {
+            "in_use": totals[0], "idle": totals[1], "queued": totals[2],
+            "max": _llm_limits().max_connections * 2,
+        }
+
+    if session is not None:
+        in_use, idle = _urllib3_pool_usage(session.get_adapter("https://"))
+        usage["firecrawl"] = {"in_use": in_use, "idle": idle, "max": _firecrawl_pool_size}
+
+    return usage
+
+
+def _connection_samples():
+    return {
+        (client, state): usage[state]
+        for client, usage in pool_usage().items()
+        for state in ("in_use", "idle", "queued") if state in usage
+    }
+
+
+def _saturation_samples():
+    return {
+        (client,): round(usage["in_use"] / usage["max"], 4) if usage["max"] else 0.0
+        for client, usage in pool_usage().items()
+    }
+
+
+HTTP_POOL_CONNECTIONS.set_function(_connection_samples)
+HTTP_POOL_SATURATION.set_function(_saturation_samples)
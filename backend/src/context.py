@@ -0,0 +1,119 @@
+# context.py
+
+import hashlib
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List
+from .models import ProjectRequirements, ResearchSnippet
+
+WORD = re.compile(r"[a-z0-9+#.]+")
+
+# always worth keeping when a page talks about them
+STACK_TERMS = {
+    "stack", "framework", "frontend", "backend", "database", "hosting", "deployment",
+    "api", "scalability", "performance", "cost", "pricing", "learning",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for english prose
+    return max(1, len(text) // 4)
+
+
+class ResearchContextBuilder:
+    """Turn scraped pages into a small, ranked set of snippets for the prompt.
+
+    Pages are deduplicated by url and content, split into paragraph chunks,
+    scored against the project requirements (tf-idf over the requirement
+    terms) and the best chunks are kept until the token budget runs out.
+    """
+
+    def __init__(self, chunk_chars: int = 800, top_k: int = 6, token_budget: int = 1200):
+        self.chunk_chars = chunk_chars
+        self.top_k = top_k
+        self.token_budget = token_budget
+
+    def build(self, pages: Iterable[Dict[str, Any]], requirements: ProjectRequirements) -> List[ResearchSnippet]:
+        chunks = []
+        seen_urls = set()
+        seen_content = set()
+
+        for page in pages:
+            url = page.get("url") or ""
+            markdown = page.get("markdown") or ""
+            digest = hashlib.sha1(markdown.encode()).hexdigest()
+            if not markdown or (url and url in seen_urls) or digest in seen_content:
+                continue
+            seen_urls.add(url)
+            seen_content.add(digest)
+
+            for text in self._chunk(markdown):
+                chunks.append((url, page.get("title") or "", text))
+
+        if not chunks:
+            return []
+
+        terms = self._terms(requirements)
+        chunk_words = [Counter(WORD.findall(text.lower())) for _, _, text in chunks]
+        document_frequency = Counter(word for words in chunk_words for word in words if word in terms)
+
+        scored = []
+        for (url, title, text), words in zip(chunks, chunk_words):
+            length = sum(words.values()) or 1
+            score = sum(
+                words[term] / length * math.log(1 + len(chunks) / document_frequency[term])
+                for term in terms if words[term]
+            )
+            if score > 0:
+                scored.append((score, url, title, text))
+        scored.sort(key=lambda item: item[0], reverse=True)
+
+        snippets = []
+        budget = self.token_budget
+        for score, url, title, text in scored:
+            tokens = estimate_tokens(text)
+            if tokens > budget:
+                continue
+            budget -= tokens
+            snippets.append(ResearchSnippet(url=url, title=title, text=text, score=round(score, 4)))
+            if len(snippets) == self.top_k:
+                break
+        return snippets
+
+    def _chunk(self, markdown: str) -> List[str]:
+        # pack whole paragraphs up to chunk_chars, hard-splitting any that are longer
+        chunks = []
+        current = ""
+        for paragraph in re.split(r"\n\s*\n", markdown):
+            paragraph = " ".join(paragraph.split())
+            if not paragraph:
+                continue
+            while len(paragraph) > self.chunk_chars:
+                chunks.append(paragraph[:self.chunk_chars])
+                paragraph = paragraph[self.chunk_chars:]
+            if current and len(current) + len(paragraph) + 1 > self.chunk_chars:
+                chunks.append(current)
+                current = ""
+            current = f"{current} {paragraph}".strip()
+        if current:
+            chunks.append(current)
+        return chunks
+
+    @staticmethod
+    def _terms(requirements: ProjectRequirements) -> set:
+        values = [
+            requirements.project_type,
+            requirements.scale,
+            requirements.budget,
+            requirements.timeline,
+            requirements.team_experience,
+            requirements.performance_needs,
+            *requirements.special_requirements,
+        ]
+        terms = {word for value in values for word in WORD.findall(value.lower()) if len(word) > 2}
+        return terms | STACK_TERMS
+
+
+def format_snippets(snippets: List[ResearchSnippet]) -> str:
+    return "\n\n".join(f"[{snippet.title or snippet.url}]({snippet.url})\n{snippet.text}" for snippet in snippets)
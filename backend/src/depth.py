@@ -0,0 +1,29 @@
+# depth.py
+
+from .models import ProjectRequirements
+
+# how much of the pipeline a request pays for, decided from its parsed
+# requirements right after analysis:
+#
+#   lean     - no web research, one stack in a compact schema, written by
+#              the beginner or startup prompt
+#   standard - research per the research mode, 2-3 full stacks
+#   complex  - as standard, written by the enterprise prompt
+LEAN = "lean"
+STANDARD = "standard"
+COMPLEX = "complex"
+DEPTHS = (LEAN, STANDARD, COMPLEX)
+
+
+def pipeline_depth(requirements: ProjectRequirements) -> str:
+    if (
+        requirements.scale in ("Large", "Enterprise")
+        or requirements.budget == "Enterprise"
+        or requirements.performance_needs == "Critical"
+    ):
+        return COMPLEX
+    # small, undemanding projects that have to ship fast or suit a new team
+    quick = requirements.timeline == "Days" or requirements.team_experience == "Beginner"
+    if requirements.scale == "Small" and requirements.performance_needs in ("Basic", "Medium") and quick:
+        return LEAN
+    return STANDARD
@@ -1,43 +1,262 @@
 # firecrawl.py
 
 import os
+import time
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlsplit, urlunsplit
 from firecrawl import FirecrawlApp
 from firecrawl.types import ScrapeOptions
 from dotenv import load_dotenv
+from .clients import firecrawl_session
+from .cache import MemoryCache, TieredCache, normalize_key, shared_cache
+from .metrics import FIRECRAWL_CALLS, FIRECRAWL_DURATION
 
 load_dotenv()
 
 # only choosing the specific firecrawl tools instead of making all accessible
 
 class FirecrawlService:
-    def __init__(self):
-        api_key = os.getenv("FIRECRAWL_API_KEY")
-        if not api_key:
-            raise ValueError("FIRECRAWL_API_KEY environment variable is not set.")
-        
-        self.app = FirecrawlApp(api_key=api_key)
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        call_timeout: Optional[float] = None,
+        app: Optional[Any] = None,
+        cache: Optional[TieredCache] = None,
+    ):
+        self.call_timeout = call_timeout or float(os.getenv("FIRECRAWL_CALL_TIMEOUT", "20"))
+        if app is None:
+            api_key = os.getenv("FIRECRAWL_API_KEY")
+            if not api_key:
+                raise ValueError("FIRECRAWL_API_KEY environment variable is not set.")
+            # the http timeout makes a hung call give its pool thread back;
+            # a running future can't be cancelled from research(), and sdk retries
+            # would multiply the time the thread is held
+            app = FirecrawlApp(api_key=api_key, timeout=self.call_timeout, max_retries=1)
+            # route the sdk's requests through one keep-alive session
+            firecrawl_session()
+
+        self.app = app
+        self.cache = cache if cache is not None else self._default_cache()
+
+        # one pool per service so the limit holds across concurrent requests
+        # and keeps us under firecrawl's rate limits
+        self.max_concurrency = max_concurrency or int(os.getenv("FIRECRAWL_MAX_CONCURRENCY", "4"))
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency,
+            thread_name_prefix="firecrawl",
+        )
+
+        self._stats = Counter()
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def _default_cache() -> TieredCache:
+        ttl = float(os.getenv("FIRECRAWL_CACHE_TTL", "86400"))
+        memory = MemoryCache(max_entries=int(os.getenv("FIRECRAWL_CACHE_SIZE", "512")), ttl=ttl)
+
+        # an empty path turns the disk tier off (with CACHE_BACKEND=sqlite);
+        # it is opened on first use
+        return TieredCache(memory, open_disk=lambda: shared_cache(
+            "firecrawl",
+            max_entries=int(os.getenv("FIRECRAWL_CACHE_DISK_SIZE", "10000")),
+            ttl=ttl,
+            path=os.getenv("FIRECRAWL_CACHE_PATH", ".cache/firecrawl.sqlite"),
+        ))
 
     def search_companies(self, query: str, num_results: int = 5):
         try:
-            result = self.app.search(
-                query=f"{query} company pricing",
-                limit=num_results,
-                scrape_options=ScrapeOptions(
-                    formats=["markdown"]
+            with FIRECRAWL_DURATION.time(operation="search"):
+                result = self.app.search(
+                    query=f"{query} company pricing",
+                    limit=num_results,
+                    # firecrawl stops working on the call at the same deadline (ms)
+                    timeout=int(self.call_timeout * 1000),
+                    scrape_options=ScrapeOptions(
+                        formats=["markdown"]
+                    )
                 )
-            )
+            FIRECRAWL_CALLS.inc(operation="search", outcome="ok")
             return result
         except Exception as e:
+            FIRECRAWL_CALLS.inc(operation="search", outcome="error")
             print(f"Error during search: {e}")
             return []
-    
+
     def scrape_company_pages(self, url: str):
         try:
-            result = self.app.scrape_url(
-                url,
-                formats=["markdown"],
-            )
+            with FIRECRAWL_DURATION.time(operation="scrape"):
+                result = self.app.scrape(
+                    url,
+                    formats=["markdown"],
+                    timeout=int(self.call_timeout * 1000),
+                )
+            FIRECRAWL_CALLS.inc(operation="scrape", outcome="ok")
             return result
         except Exception as e:
+            FIRECRAWL_CALLS.inc(operation="scrape", outcome="error")
             print(f"Error during scraping: {e}")
             return None
+
+    def research(
+        self,
+        queries: List[str],
+        num_results: int = 2,
+        on_progress: Optional[Callable[[Dict[str, int]], None]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Search all queries concurrently and scrape only the hits that need it.
+
+        Search hits already carry markdown (see search_companies), so a page
+        is scraped only when that content is missing. URLs repeated across
+        queries are kept once. Calls running longer than call_timeout are
+        abandoned and whatever finished is returned. on_progress, if given, is
+        called after every finished call.
+        """
+        pages: Dict[tuple, Dict[str, Any]] = {}
+        pending: Dict[Any, tuple] = {}
+        seen_urls = set()
+        completed = 0
+
+        for query_index, query in enumerate(queries):
+            self._submit(pending, "search", (query_index, query), self.cached_search, query, num_results)
+
+        while pending:
+            done, _ = wait(pending, timeout=self._next_timeout(pending), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                kind, payload, _ = pending.pop(future)
+                result = future.result()
+
+                if kind == "search":
+                    query_index, _ = payload
+                    for hit_index, item in enumerate(result):
+                        page = dict(item)
+                        url = _normalize_url(page.get("url") or "")
+                        if url:
+                            if url in seen_urls:
+                                self._count("duplicates_skipped")
+                                continue
+                            seen_urls.add(url)
+                        pages[(query_index, hit_index)] = page
+
+                        if page.get("markdown"):
+                            self._count("scrapes_saved")
+                        elif url:
+                            self._submit(
+                                pending, "scrape", (query_index, hit_index),
+                                self.cached_scrape, page["url"]
+                            )
+                elif result:
+                    pages[payload]["markdown"] = result
+
+                completed += 1
+                if on_progress is not None:
+                    on_progress({"completed": completed, "pending": len(pending), "pages": len(pages)})
+
+            now = time.monotonic()
+            for future, (kind, payload, clock) in list(pending.items()):
+                if clock["started"] is not None and now - clock["started"] > self.call_timeout:
+                    # the sdk's own timeout ends the call and frees its thread
+                    print(f"Firecrawl {kind} timed out after {self.call_timeout}s, skipping")
+                    del pending[future]
+
+        return [pages[key] for key in sorted(pages)]
+
+    def cached_search(self, query: str, num_results: int = 5) -> List[Dict[str, Any]]:
+        """search_companies as plain page dicts, served from cache when possible"""
+        key = f"search:{num_results}:{normalize_key(query)}"
+        pages = self.cache.get(key)
+        if pages is not None:
+            self._count("search_cache_hits")
+            return pages
+
+        self._count("search_requests")
+        pages = [_as_page(item) for item in _result_items(self.search_companies(query, num_results))]
+        # errors come back as an empty list, don't pin them in the cache
+        if pages:
+            self.cache.set(key, pages)
+        return pages
+
+    def cached_scrape(self, url: str) -> Optional[str]:
+        """Markdown for a page via scrape_company_pages, served from cache when possible"""
+        key = f"scrape:{_normalize_url(url)}"
+        markdown = self.cache.get(key)
+        if markdown is not None:
+            self._count("scrape_cache_hits")
+            return markdown
+
+        self._count("scrape_requests")
+        markdown = _field(self.scrape_company_pages(url), "markdown")
+        if markdown:
+            self.cache.set(key, markdown)
+        return markdown
+
+    def stats(self) -> Dict[str, Any]:
+        """Firecrawl calls made and saved since the service was created"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["cache"] = self.cache.stats()
+        return stats
+
+    def _count(self, name: str, amount: int = 1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def _submit(self, pending: Dict[Any, tuple], kind: str, payload: Any, func, *args):
+        clock = {"started": None}
+
+        def call():
+            clock["started"] = time.monotonic()
+            return func(*args)
+
+        pending[self._executor.submit(call)] = (kind, payload, clock)
+
+    def _next_timeout(self, pending: Dict[Any, tuple]) -> float:
+        # wake up when the oldest running call hits its deadline; calls still
+        # queued behind the concurrency limit have not started their clock
+        now = time.monotonic()
+        remaining = [
+            clock["started"] + self.call_timeout - now
+            for _, _, clock in pending.values()
+            if clock["started"] is not None
+        ]
+        return max(0.01, min(remaining)) if remaining else 0.1
+
+
+def _field(item: Any, name: str) -> Any:
+    if isinstance(item, dict):
+        return item.get(name)
+    return getattr(item, name, None)
+
+
+def _normalize_url(url: str) -> str:
+    # treat http/https, host case, fragments and trailing slashes as the same page
+    parts = urlsplit(url.strip())
+    if not parts.netloc:
+        return url.strip()
+    path = parts.path.rstrip("/")
+    return urlunsplit(("https", parts.netloc.lower(), path, parts.query, ""))
+
+
+def _result_items(result: Any) -> List[Any]:
+    # SearchData keeps its hits per source; images carry no page text
+    if isinstance(result, list):
+        return result
+    return [*(_field(result, "web") or []), *(_field(result, "news") or [])]
+
+
+def _as_page(item: Any) -> Dict[str, Any]:
+    """A search hit as a plain page dict: url, title, description and markdown.
+
+    Plain web results carry url and title themselves; scraped hits are
+    Documents that keep them in their metadata.
+    """
+    metadata = _field(item, "metadata") or {}
+    return {
+        "url": _field(item, "url") or _field(metadata, "url") or _field(metadata, "source_url") or "",
+        "title": _field(item, "title") or _field(metadata, "title") or "",
+        "description": _field(item, "description") or _field(metadata, "description") or "",
+        "markdown": _field(item, "markdown") or "",
+    }
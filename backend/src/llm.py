@@ -0,0 +1,363 @@
+# llm.py
+
+import asyncio
+import contextvars
+import math
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from langchain_openai import ChatOpenAI
+from .clients import llm_http_clients
+from .metrics import LLM_RESILIENCE
+
+DEEPSEEK_URL = "https://api.deepseek.com"
+
+# default deadline (seconds) for a whole llm call in each workflow step:
+# every retry, hedge and fallback attempt plus streaming the reply.
+# LLM_DEADLINE_<STEP> overrides one step, LLM_DEADLINE the rest
+STEP_DEADLINES = {
+    "analyze_requirements": 30.0,
+    "generate_recommendations": 120.0,
+    "write_analysis": 45.0,
+}
+
+
+def chat_model(model: str = "deepseek-chat", base_url: str = DEEPSEEK_URL, api_key: Optional[str] = None) -> ChatOpenAI:
+    """ChatOpenAI on the shared keep-alive pools (see clients.py), in json mode"""
+    http_client, http_async_client = llm_http_clients()
+    return ChatOpenAI(
+        model=model,
+        temperature=0.1,
+        base_url=base_url,
+        api_key=api_key or os.getenv("DEEPSEEK_API_KEY"),
+        # report token usage on the final streamed chunk
+        stream_usage=True,
+        # json mode: the reply is always a bare JSON object, no fences or prose.
+        # sent as extra_body so langchain keeps the plain streaming path
+        # (a top-level response_format switches to the beta stream, which
+        # drops the usage chunk)
+        extra_body={"response_format": {"type": "json_object"}},
+        http_client=http_client,
+        http_async_client=http_async_client,
+    )
+
+
+def _retryable(error: Exception) -> bool:
+    # client errors other than timeouts, conflicts and rate limits fail the same way again
+    status = getattr(error, "status_code", None)
+    return not isinstance(status, int) or status in (408, 409, 429) or status >= 500
+
+
+class LatencyTracker:
+    """Rolling window of time-to-first-chunk per step"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, step: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(step, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, step: str, percentile: float) -> Optional[float]:
+        """None until the step has enough samples to say"""
+        with self._lock:
+            samples = sorted(self._samples.get(step, ()))
+        if len(samples) < self.min_samples:
+            return None
+        index = min(len(samples) - 1, math.ceil(percentile / 100 * len(samples)) - 1)
+        return samples[max(index, 0)]
+
+
+class ResilientLLM:
+    """Deadlines, retries, hedged requests and model fallback around a chat model.
+
+    stream()/astream() take the workflow step name and keep the wrapped
+    model's chunk interface. Only the wait for the first chunk is retried or
+    hedged: once a reply starts streaming its chunks are with the caller, so
+    a failure after that is raised as-is. Each attempt runs in its own
+    thread (stream) or task (astream) and hands chunks over a queue, which
+    lets a hedged attempt race the first one and the loser be dropped.
+
+    An attempt that fails or shows no first chunk within first_chunk_timeout
+    is retried after a jittered backoff, up to retries times; after that the
+    fallback model gets one attempt. With hedge_percentile set, a primary
+    attempt still waiting past that percentile of the step's recent
+    first-chunk latencies gets a duplicate request and the first to answer
+    wins. The whole call is bounded by the step's deadline.
+    """
+
+    def __init__(
+        self,
+        llm: Any,
+        fallback: Optional[Any] = None,
+        retries: Optional[int] = None,
+        backoff: Optional[float] = None,
+        first_chunk_timeout: Optional[float] = None,
+        hedge_percentile: Optional[float] = None,
+        deadlines: Optional[Dict[str, float]] = None,
+    ):
+        self.llm = llm
+        self.fallback = fallback
+        self.retries = int(os.getenv("LLM_RETRIES", "2")) if retries is None else retries
+        self.backoff = backoff or float(os.getenv("LLM_RETRY_BACKOFF", "0.5"))
+        self.first_chunk_timeout = first_chunk_timeout or float(os.getenv("LLM_FIRST_CHUNK_TIMEOUT", "20"))
+        # 0 turns hedging off
+        self.hedge_percentile = (
+            float(os.getenv("LLM_HEDGE_PERCENTILE", "95")) if hedge_percentile is None else hedge_percentile
+        )
+        self.deadlines = dict(STEP_DEADLINES)
+        self.deadlines.update(deadlines or {})
+        self.latency = LatencyTracker()
+
+    def __getattr__(self, name):
+        # anything else (model_name, invoke, ...) is the primary model's
+        return getattr(self.llm, name)
+
+    def deadline(self, step: str) -> float:
+        default = self.deadlines.get(step, float(os.getenv("LLM_DEADLINE", "60")))
+        return float(os.getenv(f"LLM_DEADLINE_{step.upper()}", default))
+
+    def _plan(self) -> List[Tuple[Any, str]]:
+        plan = [(self.llm, "primary")] * (self.retries + 1)
+        if self.fallback is not None:
+            plan.append((self.fallback, "fallback"))
+        return plan
+
+    def _hedge_delay(self, step: str, label: str) -> Optional[float]:
+        if label != "primary" or not self.hedge_percentile:
+            return None
+        return self.latency.percentile(step, self.hedge_percentile)
+
+    def _backoff(self, retry: int, deadline: float) -> float:
+        # full jitter, never past the deadline
+        delay = random.uniform(0, self.backoff * 2 ** (retry - 1))
+        return max(0.0, min(delay, deadline - time.monotonic()))
+
+    def _count_round(self, step: str, label: str):
+        LLM_RESILIENCE.inc(step=step, path="fallback" if label == "fallback" else "retry")
+
+    def _deadline_error(self, step: str) -> TimeoutError:
+        LLM_RESILIENCE.inc(step=step, path="deadline")
+        return TimeoutError(f"LLM call for {step} passed its {self.deadline(step):g}s deadline")
+
+    # sync: one thread per attempt
+
+    def stream(self, messages: List[Any], step: str = "llm", **kwargs):
+        deadline = time.monotonic() + self.deadline(step)
+        results: queue.Queue = queue.Queue()
+        cancelled: Dict[int, threading.Event] = {}
+        try:
+            winner, first = self._race(step, messages, kwargs, deadline, results, cancelled)
+            if first is None:
+                return
+            yield first
+            while True:
+                remaining = deadline - time.monotonic()
+                try:
+                    attempt, kind, payload = results.get(timeout=max(remaining, 0))
+                except queue.Empty:
+                    raise self._deadline_error(step)
+                if attempt != winner:
+                    continue
+                if kind == "chunk":
+                    yield payload
+                elif kind == "error":
+                    raise payload
+                else:
+                    return
+        finally:
+            for event in cancelled.values():
+                event.set()
+
+    def _race(self, step, messages, kwargs, deadline, results, cancelled) -> Tuple[int, Any]:
+        last_error: Optional[Exception] = None
+        for number, (model, label) in enumerate(self._plan()):
+            if time.monotonic() >= deadline:
+                break
+            if number:
+                self._count_round(step, label)
+                time.sleep(self._backoff(number, deadline))
+
+            started = time.monotonic()
+            live = {self._spawn(model, messages, kwargs, results, cancelled)}
+            hedges = set()
+            hedge_delay = self._hedge_delay(step, label)
+            hedge_at = started + hedge_delay if hedge_delay is not None else None
+            give_up = min(deadline, started + self.first_chunk_timeout)
+
+            while live:
+                now = time.monotonic()
+                wake = give_up if hedge_at is None else min(give_up, hedge_at)
+                try:
+                    attempt, kind, payload = results.get(timeout=max(wake - now, 0))
+                except queue.Empty:
+                    if hedge_at is not None and time.monotonic() >= hedge_at and time.monotonic() < give_up:
+                        LLM_RESILIENCE.inc(step=step, path="hedge")
+                        hedge = self._spawn(model, messages, kwargs, results, cancelled)
+                        live.add(hedge)
+                        hedges.add(hedge)
+                        hedge_at = None
+                        continue
+                    break
+                if attempt not in live:
+                    continue  # a dropped attempt from an earlier round
+                if kind == "error":
+                    live.discard(attempt)
+                    last_error = payload
+                    if not _retryable(payload):
+                        raise payload
+                    continue
+                self.latency.observe(step, time.monotonic() - started)
+                if attempt in hedges:
+                    LLM_RESILIENCE.inc(step=step, path="hedge_win")
+                for other in live - {attempt}:
+                    cancelled[other].set()
+                return attempt, payload if kind == "chunk" else None
+
+            if live:
+                LLM_RESILIENCE.inc(step=step, path="timeout")
+                for attempt in live:
+                    cancelled[attempt].set()
+                last_error = TimeoutError(f"No reply for {step} within {self.first_chunk_timeout:g}s")
+
+        if time.monotonic() >= deadline:
+            raise self._deadline_error(step)
+        raise last_error or RuntimeError(f"LLM call for {step} failed")
+
+    def _spawn(self, model, messages, kwargs, results, cancelled) -> int:
+        attempt = len(cancelled)
+        cancelled[attempt] = threading.Event()
+        # carry the caller's context (callbacks, tracing) into the thread
+        context = contextvars.copy_context()
+        threading.Thread(
+            target=context.run,
+            args=(self._produce, model, attempt, messages, kwargs, results, cancelled[attempt]),
+            daemon=True,
+        ).start()
+        return attempt
+
+    @staticmethod
+    def _produce(model, attempt, messages, kwargs, results, cancelled):
+        stream = model.stream(messages, **kwargs)
+        try:
+            for chunk in stream:
+                if cancelled.is_set():
+                    return
+                results.put((attempt, "chunk", chunk))
+            results.put((attempt, "done", None))
+        except Exception as e:
+            results.put((attempt, "error", e))
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+
+    # async: one task per attempt
+
+    async def astream(self, messages: List[Any], step: str = "llm", **kwargs):
+        deadline = time.monotonic() + self.deadline(step)
+        results: asyncio.Queue = asyncio.Queue()
+        tasks: Dict[int, asyncio.Task] = {}
+        try:
+            winner, first = await self._arace(step, messages, kwargs, deadline, results, tasks)
+            if first is None:
+                return
+            yield first
+            while True:
+                try:
+                    async with asyncio.timeout(max(deadline - time.monotonic(), 0)):
+                        attempt, kind, payload = await results.get()
+                except TimeoutError:
+                    raise self._deadline_error(step)
+                if attempt != winner:
+                    continue
+                if kind == "chunk":
+                    yield payload
+                elif kind == "error":
+                    raise payload
+                else:
+                    return
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+    async def _arace(self, step, messages, kwargs, deadline, results, tasks) -> Tuple[int, Any]:
+        last_error: Optional[Exception] = None
+        for number, (model, label) in enumerate(self._plan()):
+            if time.monotonic() >= deadline:
+                break
+            if number:
+                self._count_round(step, label)
+                await asyncio.sleep(self._backoff(number, deadline))
+
+            started = time.monotonic()
+            live = {self._aspawn(model, messages, kwargs, results, tasks)}
+            hedges = set()
+            hedge_delay = self._hedge_delay(step, label)
+            hedge_at = started + hedge_delay if hedge_delay is not None else None
+            give_up = min(deadline, started + self.first_chunk_timeout)
+
+            while live:
+                wake = give_up if hedge_at is None else min(give_up, hedge_at)
+                try:
+                    async with asyncio.timeout(max(wake - time.monotonic(), 0)):
+                        attempt, kind, payload = await results.get()
+                except TimeoutError:
+                    if hedge_at is not None and time.monotonic() >= hedge_at and time.monotonic() < give_up:
+                        LLM_RESILIENCE.inc(step=step, path="hedge")
+                        hedge = self._aspawn(model, messages, kwargs, results, tasks)
+                        live.add(hedge)
+                        hedges.add(hedge)
+                        hedge_at = None
+                        continue
+                    break
+                if attempt not in live:
+                    continue
+                if kind == "error":
+                    live.discard(attempt)
+                    last_error = payload
+                    if not _retryable(payload):
+                        raise payload
+                    continue
+                self.latency.observe(step, time.monotonic() - started)
+                if attempt in hedges:
+                    LLM_RESILIENCE.inc(step=step, path="hedge_win")
+                for other in live - {attempt}:
+                    tasks[other].cancel()
+                return attempt, payload if kind == "chunk" else None
+
+            if live:
+                LLM_RESILIENCE.inc(step=step, path="timeout")
+                for attempt in live:
+                    tasks[attempt].cancel()
+                last_error = TimeoutError(f"No reply for {step} within {self.first_chunk_timeout:g}s")
+
+        if time.monotonic() >= deadline:
+            raise self._deadline_error(step)
+        raise last_error or RuntimeError(f"LLM call for {step} failed")
+
+    def _aspawn(self, model, messages, kwargs, results, tasks) -> int:
+        attempt = len(tasks)
+        tasks[attempt] = asyncio.create_task(self._aproduce(model, attempt, messages, kwargs, results))
+        return attempt
+
+    @staticmethod
+    async def _aproduce(model, attempt, messages, kwargs, results):
+        stream = model.astream(messages, **kwargs)
+        try:
+            async for chunk in stream:
+                results.put_nowait((attempt, "chunk", chunk))
+            results.put_nowait((attempt, "done", None))
+        except Exception as e:
+            results.put_nowait((attempt, "error", e))
+        finally:
+            aclose = getattr(stream, "aclose", None)
+            if aclose is not None:
+                await aclose()
@@ -0,0 +1,203 @@
+# metrics.py
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# minimal prometheus-style metrics, rendered in the text exposition format
+# by /api/metrics. no client library needed and safe to use offline.
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: LabelValues, extra: Optional[Dict[str, str]] = None) -> str:
+        pairs = list(zip(self.labelnames, key)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{self._labels(key)} {value}" for key, value in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+        self._function: Optional[Callable[[], Dict[LabelValues, float]]] = None
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def set_function(self, function: Callable[[], Dict[LabelValues, float]]):
+        """Compute the gauge's values at render time, keyed by label values"""
+        self._function = function
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        if self._function is not None:
+            values.update(self._function())
+        return [f"{self.name}{self._labels(key)} {value}" for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            counts[-1] += 1
+            self._sums[key] = self._sums.get(key, 0) + value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        counts = self._counts.get(self._key(labels))
+        return counts[-1] if counts else 0
+
+    def _samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key in sorted(self._counts):
+                counts = self._counts[key]
+                for bound, count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{self._labels(key, {'le': repr(float(bound))})} {count}")
+                lines.append(f"{self.name}_bucket{self._labels(key, {'le': '+Inf'})} {counts[-1]}")
+                lines.append(f"{self.name}_sum{self._labels(key)} {self._sums[key]}")
+                lines.append(f"{self.name}_count{self._labels(key)} {counts[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+    def _register(self, metric: _Metric):
+        # registering the same name twice hands back the existing metric
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+
+REGISTRY = MetricsRegistry()
+
+NODE_DURATION = REGISTRY.histogram(
+    "workflow_node_duration_seconds", "Time spent in each workflow graph node", ("node",)
+)
+LLM_CALLS = REGISTRY.counter("llm_calls_total", "LLM calls by workflow step and outcome", ("step", "outcome"))
+LLM_DURATION = REGISTRY.histogram("llm_call_duration_seconds", "LLM call latency by workflow step", ("step",))
+LLM_RESILIENCE = REGISTRY.counter(
+    "llm_resilience_total", "LLM call paths taken by step (retry/hedge/hedge_win/fallback/timeout/deadline)", ("step", "path")
+)
+LLM_TOKENS = REGISTRY.counter("llm_tokens_total", "LLM tokens by workflow step and kind (prompt/completion)", ("step", "kind"))
+PROMPT_TOKENS_SAVED = REGISTRY.counter(
+    "prompt_tokens_saved_total", "Prompt tokens saved by compaction or trimmed to fit the step budget", ("step", "reason")
+)
+FIRECRAWL_CALLS = REGISTRY.counter("firecrawl_calls_total", "Firecrawl API calls by operation and outcome", ("operation", "outcome"))
+FIRECRAWL_DURATION = REGISTRY.histogram("firecrawl_call_duration_seconds", "Firecrawl API call latency", ("operation",))
+HTTP_DURATION = REGISTRY.histogram("http_request_duration_seconds", "API request latency", ("method", "path", "status"))
+HTTP_POOL_CONNECTIONS = REGISTRY.gauge(
+    "http_pool_connections", "Shared outbound connection pools by client and state (in_use/idle/queued)", ("client", "state")
+)
+HTTP_POOL_SATURATION = REGISTRY.gauge("http_pool_saturation", "Fraction of each outbound pool's connections in use", ("client",))
+PIPELINE_DEPTH = REGISTRY.counter("pipeline_depth_total", "Requests by pipeline depth (lean/standard/complex)", ("depth",))
+ADMISSION_DECISIONS = REGISTRY.counter(
+    "admission_decisions_total", "Admission control outcomes (admitted/queued/rate_limited/queue_full/queue_timeout)", ("outcome",)
+)
+ADMISSION_WAIT = REGISTRY.histogram(
+    "admission_wait_seconds", "Time admitted runs waited in the queue by priority", ("priority",),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+ADMISSION_QUEUE_DEPTH = REGISTRY.gauge("admission_queue_depth", "Runs waiting for a slot")
+ADMISSION_IN_FLIGHT = REGISTRY.gauge("admission_in_flight", "Slots held by running workflows")
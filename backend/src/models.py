@@ -1,32 +1,43 @@
-from typing import List, Optional, Dict, Any
-from pydantic import BaseModel
+from typing import Annotated, Any, Dict, List, Optional
+from pydantic import BaseModel, ConfigDict
+from pydantic.alias_generators import to_camel
+
+
+def merge_timings(left: Dict[str, Any], right: Dict[str, Any]) -> Dict[str, Any]:
+    """Reducer so parallel graph branches can each report their node timings (and prompt sizes)"""
+    return {**(left or {}), **(right or {})}
 
 
 class TechStackComponent(BaseModel):
     """Individual component of a tech stack"""
-    name: str
-    category: str  # frontend, backend, database, deployment, etc.
-    description: str
+    # snake_case from the llm, camelCase (by_alias) for the frontend
+    model_config = ConfigDict(alias_generator=to_camel, populate_by_name=True)
+
+    name: str = ""
+    category: str = ""  # frontend, backend, database, deployment, etc.
+    description: str = ""
     pros: List[str] = []
     cons: List[str] = []
-    learning_curve: str  # Easy, Medium, Hard
-    popularity: str  # Low, Medium, High
-    cost: str  # Free, Paid, Enterprise
+    learning_curve: str = "Medium"  # Easy, Medium, Hard
+    popularity: str = "Medium"  # Low, Medium, High
+    cost: str = "Free"  # Free, Paid, Enterprise
     use_cases: List[str] = []
 
 
 class TechStack(BaseModel):
     """Complete tech stack recommendation"""
-    name: str  # e.g., "MERN Stack", "LAMP Stack", "JAMStack"
-    description: str
+    model_config = ConfigDict(alias_generator=to_camel, populate_by_name=True)
+
+    name: str = ""  # e.g., "MERN Stack", "LAMP Stack", "JAMStack"
+    description: str = ""
     components: List[TechStackComponent] = []
     
     # Stack characteristics
-    complexity: str  # Simple, Moderate, Complex
-    time_to_market: str  # Fast, Medium, Slow
-    scalability: str  # Low, Medium, High
-    cost_estimate: str  # $0-100/month, $100-500/month, etc.
-    team_size_fit: str  # Solo, Small (2-5), Medium (5-15), Large (15+)
+    complexity: str = "Moderate"  # Simple, Moderate, Complex
+    time_to_market: str = "Medium"  # Fast, Medium, Slow
+    scalability: str = "Medium"  # Low, Medium, High
+    cost_estimate: str = ""  # $0-100/month, $100-500/month, etc.
+    team_size_fit: str = "Small"  # Solo, Small (2-5), Medium (5-15), Large (15+)
     
     # Specific benefits
     best_for: List[str] = []  # MVP, Startup, Enterprise, etc.
@@ -38,19 +49,41 @@ class TechStack(BaseModel):
 
 class ProjectRequirements(BaseModel):
     """Analysis of project requirements from user input"""
-    project_type: str  # Web App, Mobile App, API, Desktop, etc.
-    scale: str  # MVP, Small, Medium, Large, Enterprise
-    budget: str  # Low, Medium, High, Enterprise
-    timeline: str  # Days, Weeks, Months, Long-term
-    team_experience: str  # Beginner, Intermediate, Advanced
-    performance_needs: str  # Basic, High, Enterprise
+    model_config = ConfigDict(alias_generator=to_camel, populate_by_name=True)
+
+    project_type: str = "Web App"  # Web App, Mobile App, API, Desktop, etc.
+    scale: str = "Medium"  # MVP, Small, Medium, Large, Enterprise
+    budget: str = "Medium"  # Low, Medium, High, Enterprise
+    timeline: str = "Weeks"  # Days, Weeks, Months, Long-term
+    team_experience: str = "Intermediate"  # Beginner, Intermediate, Advanced
+    performance_needs: str = "Basic"  # Basic, High, Enterprise
     special_requirements: List[str] = []  # Real-time, AI/ML, etc.
 
 
+class RecommendationSummary(BaseModel):
+    """Top-level fields of the recommendation response besides the stacks"""
+    analysis: str = "Tech stack recommendations generated successfully."
+
+
+class ResearchSnippet(BaseModel):
+    """Ranked excerpt of a researched page, kept instead of the full page"""
+    url: str
+    title: str = ""
+    text: str
+    score: float = 0.0
+
+
 class StackRecommendationState(BaseModel):
     """State for the tech stack recommendation workflow"""
     query: str
     project_requirements: Optional[ProjectRequirements] = None
     recommended_stacks: List[TechStack] = []
-    search_results: List[Dict[str, Any]] = []
-    analysis: Optional[str] = None  # Overall recommendation explanation
\ No newline at end of file
+    research_snippets: List[ResearchSnippet] = []  # Bounded, ranked research context
+    analysis: Optional[str] = None  # Overall recommendation explanation
+    cache_hit: bool = False  # Recommendations served from the recommendation cache
+    catalog_hit: bool = False  # Stacks served from the stack catalog, only the analysis generated
+    pipeline_depth: str = "standard"  # lean, standard or complex; decides research and stack count
+    research_mode: str = "serial"  # serial, parallel or off: the graph the run was started on
+    timings: Annotated[Dict[str, float], merge_timings] = {}  # Seconds spent in each graph node
+    prompt_tokens: Annotated[Dict[str, Dict[str, int]], merge_timings] = {}  # Per llm step: tokens sent, saved and trimmed
+    thread_id: Optional[str] = None  # Checkpoint thread; pass it back to retry or regenerate the run
\ No newline at end of file
@@ -0,0 +1,90 @@
+# parsing.py
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+Path = Tuple[Any, ...]
+
+
+class IncrementalJSONParser:
+    """Parse JSON text as it streams in, reporting objects as soon as they close.
+
+    feed() takes the next chunk of LLM output and returns (path, text) for
+    every object completed by it, where text is the object's raw JSON. The
+    path holds the keys and array indexes leading to the object, e.g.
+    ("recommended_stacks", 0, "components", 1); the root object has the path
+    (). Nothing is decoded here: callers validate the objects they care
+    about straight from the text (model_validate_json), so nested objects
+    aren't json.loads-ed once per enclosing level. Anything before the first
+    "{" (such as a ```json fence) and anything after the root object closes
+    is ignored.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._stack: List[Dict[str, Any]] = []
+        self._in_string = False
+        self._escaped = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._started = False
+        self.root_json: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        return self.root_json is not None
+
+    def feed(self, chunk: str) -> List[Tuple[Path, str]]:
+        if self.done or not chunk:
+            return []
+
+        offset = len(self._text)
+        self._text += chunk
+        completed = []
+
+        for position in range(offset, len(self._text)):
+            char = self._text[position]
+
+            if not self._started:
+                if char == "{":
+                    self._started = True
+                    self._open(char, position)
+                continue
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = self._text[self._string_start:position + 1]
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = position
+            elif char in "{[":
+                self._open(char, position)
+            elif char in "}]":
+                container = self._stack.pop()
+                if char == "}":
+                    text = self._text[container["start"]:position + 1]
+                    completed.append((container["path"], text))
+                    if not self._stack:
+                        self.root_json = text
+                        break
+            elif char == ":" and self._stack and self._stack[-1]["kind"] == "{":
+                self._stack[-1]["key"] = json.loads(self._last_string) if self._last_string else None
+            elif char == "," and self._stack and self._stack[-1]["kind"] == "[":
+                self._stack[-1]["index"] += 1
+
+        return completed
+
+    def _open(self, char: str, position: int):
+        if self._stack:
+            parent = self._stack[-1]
+            path = parent["path"] + (parent["key"] if parent["kind"] == "{" else parent["index"],)
+        else:
+            path = ()
+        self._stack.append({"kind": char, "start": position, "path": path, "key": None, "index": 0})
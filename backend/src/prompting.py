@@ -0,0 +1,189 @@
+# prompting.py
+
+import inspect
+import json
+import os
+import re
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, NamedTuple, Optional
+from langchain_core.messages import HumanMessage, SystemMessage
+from .context import estimate_tokens
+from .metrics import PROMPT_TOKENS_SAVED
+
+# default token budget for the whole prompt (system + user) of each llm
+# step. PROMPT_BUDGET_<STEP> overrides one step, PROMPT_BUDGET the rest
+STEP_BUDGETS = {
+    "analyze_requirements": 800,
+    "generate_recommendations": 2500,
+    "write_analysis": 1200,
+}
+
+BLANK_LINES = re.compile(r"\n{3,}")
+TRUNCATED = "\n[truncated]"
+
+_encoding: Any = None  # None until loaded, False when unavailable
+_encoding_lock = threading.Lock()
+_loading: Optional[threading.Thread] = None
+
+
+def _reset_after_fork():
+    # a load still running in the parent does not carry over to the child
+    global _encoding_lock, _loading
+    _encoding_lock = threading.Lock()
+    if _encoding is None:
+        _loading = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _load_encoding(name: str):
+    global _encoding
+    try:
+        import tiktoken
+        _encoding = tiktoken.get_encoding(name)
+    except Exception as e:
+        print(f"Tokenizer {name} unavailable, estimating prompt tokens: {e}")
+        _encoding = False
+
+
+def _tokenizer(wait: bool = False) -> Optional[Any]:
+    # tiktoken downloads its tables on first use, so they load on a
+    # background thread and counts use the ~4 chars/token estimate until
+    # then (and for good when offline or with PROMPT_TOKENIZER empty)
+    global _encoding, _loading
+    with _encoding_lock:
+        if _loading is None:
+            name = os.getenv("PROMPT_TOKENIZER", "cl100k_base")
+            _loading = threading.Thread(target=_load_encoding, args=(name,), name="tokenizer", daemon=True)
+            if name:
+                _loading.start()
+            else:
+                _encoding = False
+    if wait and _loading.is_alive():
+        _loading.join()
+    return _encoding or None
+
+
+def load_tokenizer() -> bool:
+    """Load the tokenizer tables now; False when token counts are estimated"""
+    return _tokenizer(wait=True) is not None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _tokenizer()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, tokens: int) -> str:
+    """At most `tokens` tokens of text, cut back to a line break when there is one"""
+    if tokens <= 0:
+        return ""
+    encoding = _tokenizer()
+    if encoding is None:
+        head = text[:tokens * 4]
+    else:
+        head = encoding.decode(encoding.encode(text, disallowed_special=())[:tokens])
+    if len(head) >= len(text):
+        return text
+    cut = head.rfind("\n")
+    return head[:cut] if cut > len(head) // 2 else head
+
+
+def _minify_json(lines: List[str]) -> List[str]:
+    # pretty-printed json blocks (the schemas and examples) go on one line
+    out: List[str] = []
+    block: List[str] = []
+    depth = 0
+    for line in lines:
+        if not block and not line.startswith(("{", "[")):
+            out.append(line)
+            continue
+        block.append(line)
+        depth += line.count("{") + line.count("[") - line.count("}") - line.count("]")
+        if depth > 0:
+            continue
+        try:
+            out.append(json.dumps(json.loads("".join(block)), separators=(",", ":")))
+        except ValueError:
+            out.extend(block)
+        block, depth = [], 0
+    return out + block
+
+
+def compact(text: str) -> str:
+    """Dedent, strip every line, minify json blocks and squeeze blank lines"""
+    lines = [line.strip() for line in inspect.cleandoc(text).splitlines()]
+    return BLANK_LINES.sub("\n\n", "\n".join(_minify_json(lines))).strip()
+
+
+@lru_cache(maxsize=64)
+def _compact_static(text: str) -> tuple:
+    # system prompts are constants: compact and count them once
+    compacted = compact(text)
+    return compacted, count_tokens(text), count_tokens(compacted)
+
+
+class PromptSection(NamedTuple):
+    text: str
+    trim: bool = False  # may be cut short when the prompt is over budget
+
+
+class Prompt(NamedTuple):
+    messages: List[Any]
+    report: Dict[str, int]  # tokens sent, saved by compaction, trimmed for the budget
+
+
+class PromptBuilder:
+    """Builds compact chat messages within a per-step token budget.
+
+    The system message holds everything static (role, output schema and
+    rules), so every request starts with the same prefix and the provider's
+    prefix cache can reuse it; the user message holds only the request's
+    own sections. Templates are compacted before they are sent, and when
+    the prompt is still over budget the trimmable sections are cut short,
+    last first.
+    """
+
+    def __init__(self, budgets: Optional[Dict[str, int]] = None):
+        self.budgets = budgets
+
+    def budget(self, step: str) -> int:
+        if self.budgets and step in self.budgets:
+            return self.budgets[step]
+        override = os.getenv(f"PROMPT_BUDGET_{step.upper()}") or os.getenv("PROMPT_BUDGET")
+        return int(override) if override else STEP_BUDGETS.get(step, 2000)
+
+    def build(self, step: str, system: str, sections: List[PromptSection]) -> Prompt:
+        system_text, raw_tokens, system_tokens = _compact_static(system)
+        texts = [compact(section.text) for section in sections]
+        raw_tokens += sum(count_tokens(section.text) for section in sections)
+        tokens = system_tokens + sum(count_tokens(text) for text in texts)
+        saved = raw_tokens - tokens
+
+        trimmed = 0
+        over = tokens - self.budget(step)
+        for index in reversed(range(len(sections))):
+            if over <= 0:
+                break
+            if not sections[index].trim or not texts[index]:
+                continue
+            before = count_tokens(texts[index])
+            kept = truncate_tokens(texts[index], before - over - count_tokens(TRUNCATED))
+            texts[index] = kept + TRUNCATED if kept else ""
+            cut = before - count_tokens(texts[index])
+            trimmed += cut
+            over -= cut
+        if trimmed:
+            print(f"Prompt for {step} trimmed by {trimmed} tokens to fit its budget of {self.budget(step)}")
+
+        PROMPT_TOKENS_SAVED.inc(saved, step=step, reason="compaction")
+        PROMPT_TOKENS_SAVED.inc(trimmed, step=step, reason="budget")
+        messages = [
+            SystemMessage(content=system_text),
+            HumanMessage(content="\n\n".join(text for text in texts if text)),
+        ]
+        return Prompt(messages, {"tokens": tokens - trimmed, "saved": saved, "trimmed": trimmed})
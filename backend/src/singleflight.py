@@ -0,0 +1,165 @@
+# singleflight.py
+
+import asyncio
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Optional
+from .cache import MemoryCache, SharedCache, TieredCache
+
+
+class SingleFlight:
+    """Coalesce concurrent identical calls and memoize finished results briefly.
+
+    The first caller for a key starts the work; callers arriving while it
+    runs await the same task. Results that pass `cacheable` are kept for
+    `ttl` seconds so a burst of duplicates costs one pipeline run.
+
+    With a shared cache the memo and the dedupe reach across worker
+    processes: the first worker takes a lock entry in the shared cache and
+    runs, the others poll for its result. The lock holds a token of the
+    worker that took it, and only that worker releases it. Results go through dump/load on
+    the way in and out, so they only need to be json serializable there. A
+    worker whose wait ends without a result (the owner failed, or the lock
+    expired) runs the work itself.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 30,
+        max_entries: int = 256,
+        shared: Optional[SharedCache] = None,
+        open_shared: Optional[Callable[[], Optional[SharedCache]]] = None,
+        dump: Optional[Callable[[Any], Any]] = None,
+        load: Optional[Callable[[Any], Any]] = None,
+        lock_ttl: Optional[float] = None,
+        poll_interval: float = 0.2,
+    ):
+        # open_shared defers opening the shared cache to the first call
+        self.memo = TieredCache(MemoryCache(max_entries=max_entries, ttl=ttl), shared, open_shared)
+        self.dump = dump or (lambda result: result)
+        self.load = load or (lambda value: value)
+        # longer than a slow run, or a second worker starts the same work
+        self.lock_ttl = lock_ttl or float(os.getenv("SEARCH_LOCK_TTL", "180"))
+        self.poll_interval = poll_interval
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._stats = Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self) -> Optional[SharedCache]:
+        return self.memo.disk
+
+    async def do(
+        self,
+        key: str,
+        func: Callable[[], Awaitable[Any]],
+        cacheable: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        # the shared tiers are sqlite or redis calls, kept off the event loop
+        value = await asyncio.to_thread(self.memo.get, key)
+        if value is not None:
+            self._count("memo_hits")
+            return self.load(value)
+
+        task = self._inflight.get(key)
+        if task is None:
+            # run detached from the caller so a disconnecting client doesn't
+            # cancel the work for everyone waiting on it
+            task = asyncio.ensure_future(self._run(key, func, cacheable))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self._count("coalesced")
+
+        return await asyncio.shield(task)
+
+    async def _run(
+        self,
+        key: str,
+        func: Callable[[], Awaitable[Any]],
+        cacheable: Optional[Callable[[Any], bool]],
+    ) -> Any:
+        if self.shared is None:
+            return await self._execute(key, func, cacheable)
+
+        lock = f"lock:{key}"
+        # a token of our own, so only the owner ever releases the lock
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_ttl
+        owned = False
+        try:
+            while not owned:
+                owned = await asyncio.to_thread(self.shared.add, lock, token, self.lock_ttl)
+                if owned:
+                    break
+                # another worker is on it
+                value = await asyncio.to_thread(self.shared.get, key)
+                if value is not None:
+                    self._count("remote_hits")
+                    return self.load(value)
+                if time.monotonic() >= deadline:
+                    # run without the lock; it still belongs to the other worker
+                    break
+                await asyncio.sleep(self.poll_interval)
+            # the previous owner may have finished between our polls
+            value = await asyncio.to_thread(self.shared.get, key)
+        except Exception as e:
+            # the shared cache only saves work, so without it this worker runs alone
+            self._shared_error("lock", e)
+            value = None
+        if value is not None:
+            self._count("remote_hits")
+            if owned:
+                await self._release(lock, token)
+            return self.load(value)
+
+        try:
+            return await self._execute(key, func, cacheable)
+        finally:
+            if owned:
+                await self._release(lock, token)
+
+    async def _release(self, lock: str, token: str):
+        try:
+            await asyncio.to_thread(self.shared.delete_if, lock, token)
+        except Exception as e:
+            # the lock expires on its own after lock_ttl
+            self._shared_error("unlock", e)
+
+    async def _execute(
+        self,
+        key: str,
+        func: Callable[[], Awaitable[Any]],
+        cacheable: Optional[Callable[[Any], bool]],
+    ) -> Any:
+        self._count("executions")
+        result = await func()
+        # memoized before the lock is released so waiting workers find it
+        if cacheable is None or cacheable(result):
+            await asyncio.to_thread(self.memo.set, key, self.dump(result))
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["in_flight"] = len(self._inflight)
+        stats["memo"] = self.memo.stats()
+        return stats
+
+    def _finish(self, key: str, task: asyncio.Future):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # retrieve the exception so a failed run isn't logged as never retrieved
+        if not task.cancelled():
+            task.exception()
+
+    def _shared_error(self, operation: str, error: Exception):
+        self._count("shared_errors")
+        print(f"Shared search {operation} failed, running locally: {error}")
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
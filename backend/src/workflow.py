@@ -1,86 +1,383 @@
 # workflow.py
 
 import os
+import re
 import json
-from typing import Dict, Any
+import time
+import asyncio
+import hashlib
+import uuid
+from typing import Dict, Any, List, AsyncContextManager, AsyncIterator, Callable, Iterator, NamedTuple, Optional, Tuple, Union
 from langgraph.graph import StateGraph, END
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, SystemMessage
-from .models import StackRecommendationState, TechStack, ProjectRequirements, TechStackComponent
+from langgraph.config import get_stream_writer
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from .models import StackRecommendationState, TechStack, ProjectRequirements, TechStackComponent, RecommendationSummary
 from .firecrawl import FirecrawlService
 from .prompts import TechStackPrompts
+from .prompting import Prompt, PromptBuilder
+from .cache import MemoryCache, TieredCache, normalize_key, shared_cache
+from .parsing import IncrementalJSONParser
+from .context import ResearchContextBuilder, format_snippets
+from .llm import DEEPSEEK_URL, ResilientLLM, chat_model
+from .catalog import StackCatalog
+from .checkpoints import CheckpointStore
+from .depth import LEAN, STANDARD, pipeline_depth
+from .metrics import NODE_DURATION, LLM_CALLS, LLM_DURATION, LLM_TOKENS, PIPELINE_DEPTH
 
 # steps in the workflow: analyze_requirements, research_stacks, generate_recommendations
+#
+# after analysis a recommendation cache hit ends the run, and a stack catalog
+# hit goes to write_analysis, which only writes the short comparison
+#
+# research modes:
+#   serial   - analyze -> research -> generate
+#   parallel - analyze -> (research | generate) -> merge_research
+#   off      - analyze -> generate, for latency-sensitive callers
+#
+# the requirements also pick the pipeline depth (see depth.py): lean
+# profiles skip research and get a single compact stack whatever the mode
+#
+# with a checkpointer every node's output is saved under the run's thread
+# id: retrying a thread picks up after its last finished node, and a
+# failed or regenerated thread forks from the checkpoint before generation
+RESEARCH_MODES = ("serial", "parallel", "off")
+
+# filler words dropped from the query fingerprint
+QUERY_STOPWORDS = {
+    "a", "an", "and", "the", "for", "of", "to", "with", "in", "on", "my", "our",
+    "i", "we", "need", "want", "build", "building", "create", "make", "app",
+    "application", "some", "that", "this", "is", "be", "using", "please",
+}
+
+class RunPlan(NamedTuple):
+    graph: Any
+    input: Optional[StackRecommendationState]  # None continues from the checkpoint in config
+    config: Dict[str, Any]
+    previous: Optional[StackRecommendationState] = None  # state of the resumed thread
+    finished: bool = False  # previous is a complete result, nothing left to run
+
 
 class Workflow:
-    def __init__(self):
-        self.firecrawl = FirecrawlService()
-        self.llm = ChatOpenAI(
-            model="deepseek-chat", 
-            temperature=0.1,
-            base_url="https://api.deepseek.com",
-            api_key=os.getenv("DEEPSEEK_API_KEY")
-        )
+    def __init__(
+        self,
+        llm: Optional[Any] = None,
+        firecrawl: Optional[FirecrawlService] = None,
+        research_mode: Optional[str] = None,
+        catalog: Optional[StackCatalog] = None,
+        recommendation_cache: Optional[TieredCache] = None,
+        checkpointer: Optional[CheckpointStore] = None,
+    ):
+        self.firecrawl = firecrawl or FirecrawlService()
+        if llm is None:
+            # an optional second model takes over when deepseek keeps failing
+            fallback_model = os.getenv("LLM_FALLBACK_MODEL", "")
+            fallback = None
+            if fallback_model:
+                fallback = chat_model(
+                    fallback_model,
+                    base_url=os.getenv("LLM_FALLBACK_BASE_URL", DEEPSEEK_URL),
+                    api_key=os.getenv("LLM_FALLBACK_API_KEY"),
+                )
+            llm = ResilientLLM(chat_model(), fallback=fallback)
+        elif not isinstance(llm, ResilientLLM):
+            llm = ResilientLLM(llm)
+        self.llm = llm
+        self.research_mode = research_mode or os.getenv("RESEARCH_MODE", "serial")
+        if self.research_mode not in RESEARCH_MODES:
+            raise ValueError(f"Unknown research mode: {self.research_mode}")
         self.prompts = TechStackPrompts()
-        self.workflow = self._build_workflow()
+        self.prompt_builder = PromptBuilder()
+        # 0 sends every request down the standard path
+        self.adaptive_depth = os.getenv("ADAPTIVE_DEPTH", "1") == "1"
+        self.context_builder = ResearchContextBuilder(
+            top_k=int(os.getenv("RESEARCH_CONTEXT_CHUNKS", "6")),
+            token_budget=int(os.getenv("RESEARCH_CONTEXT_TOKENS", "1200")),
+        )
+        # the shared tier lets every worker process reuse a generation; it
+        # is opened on first use, in the worker rather than at construction
+        if recommendation_cache is None:
+            recommendation_ttl = float(os.getenv("RECOMMENDATION_CACHE_TTL", "3600"))
+            recommendation_cache = TieredCache(
+                MemoryCache(max_entries=int(os.getenv("RECOMMENDATION_CACHE_SIZE", "256")), ttl=recommendation_ttl),
+                open_disk=lambda: shared_cache(
+                    "recommendations",
+                    max_entries=int(os.getenv("RECOMMENDATION_CACHE_DISK_SIZE", "5000")),
+                    ttl=recommendation_ttl,
+                ),
+            )
+        self.recommendation_cache = recommendation_cache
+        # an empty path turns the catalog off
+        catalog_path = os.getenv("STACK_CATALOG_PATH", ".cache/catalog.sqlite")
+        if catalog is None and catalog_path:
+            catalog = StackCatalog(
+                catalog_path,
+                min_stacks=int(os.getenv("STACK_CATALOG_MIN_STACKS", "2")),
+                min_similarity=float(os.getenv("STACK_CATALOG_MIN_SIMILARITY", "0.8")),
+                max_stacks=int(os.getenv("STACK_CATALOG_SIZE", "5000")),
+            )
+        self.catalog = catalog
+        # an empty path turns checkpointing (and resuming threads) off
+        checkpoint_path = os.getenv("CHECKPOINT_PATH", ".cache/checkpoints.sqlite")
+        if checkpointer is None and checkpoint_path:
+            checkpointer = CheckpointStore(
+                checkpoint_path,
+                ttl=float(os.getenv("CHECKPOINT_TTL", "86400")),
+                max_threads=int(os.getenv("CHECKPOINT_MAX_THREADS", "10000")),
+            )
+        self.checkpointer = checkpointer
+        self._graphs: Dict[str, Any] = {}
+        self.workflow = self.graph(self.research_mode)
+
+    def graph(self, research_mode: Optional[str] = None):
+        """Compiled graph for a research mode, built on first use"""
+        research_mode = research_mode or self.research_mode
+        if research_mode not in RESEARCH_MODES:
+            raise ValueError(f"Unknown research mode: {research_mode}")
+        if research_mode not in self._graphs:
+            self._graphs[research_mode] = self._build_workflow(research_mode)
+        return self._graphs[research_mode]
 
-    def _build_workflow(self):
+    def _build_workflow(self, research_mode: str = "serial"):
         graph = StateGraph(StackRecommendationState)
-        graph.add_node("analyze_requirements", self._analyze_requirements_step)
-        graph.add_node("research_stacks", self._research_stacks_step)
-        graph.add_node("generate_recommendations", self._generate_recommendations_step)
+        # each node has a sync and an async version so the compiled graph
+        # supports both invoke (cli) and ainvoke (api server)
+        graph.add_node("analyze_requirements", self._node(
+            "analyze_requirements", self._analyze_requirements_step, self._aanalyze_requirements_step
+        ))
+        graph.add_node("research_stacks", self._node(
+            "research_stacks", self._research_stacks_step, self._aresearch_stacks_step
+        ))
+        graph.add_node("generate_recommendations", self._node(
+            "generate_recommendations", self._generate_recommendations_step, self._agenerate_recommendations_step
+        ))
+        graph.add_node("write_analysis", self._node(
+            "write_analysis", self._write_analysis_step, self._awrite_analysis_step
+        ))
         graph.set_entry_point("analyze_requirements")
-        graph.add_edge("analyze_requirements", "research_stacks")
-        graph.add_edge("research_stacks", "generate_recommendations")
-        graph.add_edge("generate_recommendations", END)
-        return graph.compile()
+        graph.add_edge("write_analysis", END)
+
+        if research_mode == "serial":
+            next_nodes = ["research_stacks"]
+            graph.add_edge("research_stacks", "generate_recommendations")
+            graph.add_edge("generate_recommendations", END)
+        elif research_mode == "parallel":
+            # generation doesn't wait for research; the evidence is folded in afterwards
+            next_nodes = ["research_stacks", "generate_recommendations"]
+            graph.add_node("merge_research", self._node("merge_research", self._merge_research_step))
+            graph.add_edge(["research_stacks", "generate_recommendations"], "merge_research")
+            graph.add_edge("merge_research", END)
+        else:
+            next_nodes = ["generate_recommendations"]
+            graph.add_edge("generate_recommendations", END)
+
+        # a recommendation cache hit skips research and generation entirely;
+        # catalog stacks skip them too but still get a fresh analysis, and
+        # lean profiles skip research (in parallel mode merge_research then
+        # never fires and the run ends after generation)
+        def route_after_analysis(state: StackRecommendationState) -> List[str]:
+            if state.cache_hit:
+                return [END]
+            if state.catalog_hit:
+                return ["write_analysis"]
+            if state.pipeline_depth == LEAN:
+                return ["generate_recommendations"]
+            return next_nodes
+
+        destinations = list(dict.fromkeys([END, "write_analysis", "generate_recommendations", *next_nodes]))
+        graph.add_conditional_edges("analyze_requirements", route_after_analysis, destinations)
+        return graph.compile(checkpointer=self.checkpointer)
+
+    def _node(self, name: str, func, afunc=None) -> RunnableLambda:
+        # times every node into the metrics registry and the state's timings
+        def timed(update: Dict[str, Any], start: float) -> Dict[str, Any]:
+            elapsed = time.perf_counter() - start
+            NODE_DURATION.observe(elapsed, node=name)
+            return {**(update or {}), "timings": {name: round(elapsed, 4)}}
+
+        def run(state: StackRecommendationState) -> Dict[str, Any]:
+            start = time.perf_counter()
+            return timed(func(state), start)
+
+        async def arun(state: StackRecommendationState) -> Dict[str, Any]:
+            start = time.perf_counter()
+            update = await afunc(state) if afunc else await asyncio.to_thread(func, state)
+            return timed(update, start)
+
+        return RunnableLambda(run, afunc=arun, name=name)
+
+    def _stream_llm(self, step: str, messages: List[Any]):
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            for chunk in self.llm.stream(messages, step=step):
+                self._record_usage(step, chunk)
+                yield chunk
+            outcome = "ok"
+        finally:
+            LLM_DURATION.observe(time.perf_counter() - start, step=step)
+            LLM_CALLS.inc(step=step, outcome=outcome)
+
+    async def _astream_llm(self, step: str, messages: List[Any]):
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            async for chunk in self.llm.astream(messages, step=step):
+                self._record_usage(step, chunk)
+                yield chunk
+            outcome = "ok"
+        finally:
+            LLM_DURATION.observe(time.perf_counter() - start, step=step)
+            LLM_CALLS.inc(step=step, outcome=outcome)
+
+    def _record_usage(self, step: str, chunk: Any) -> None:
+        usage = getattr(chunk, "usage_metadata", None)
+        if usage:
+            LLM_TOKENS.inc(usage.get("input_tokens", 0), step=step, kind="prompt")
+            LLM_TOKENS.inc(usage.get("output_tokens", 0), step=step, kind="completion")
+
+    def _recommendation_key(self, query: str, requirements: ProjectRequirements, research_mode: str) -> str:
+        # many wordings map to the same requirements; the query fingerprint
+        # ignores case, punctuation, word order and filler words. the mode
+        # is kept apart so a run without research never answers one that asked for it
+        canonical = {
+            field: str(value).strip().lower()
+            for field, value in requirements.model_dump(exclude={"special_requirements"}).items()
+        }
+        canonical["research_mode"] = research_mode
+        canonical["special_requirements"] = sorted(
+            {item.strip().lower() for item in requirements.special_requirements}
+        )
+        words = set(re.findall(r"[a-z0-9+#.]+", query.lower())) - QUERY_STOPWORDS
+        canonical["query"] = sorted(words)
+        payload = json.dumps(canonical, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _pipeline_depth(self, requirements: ProjectRequirements) -> str:
+        depth = pipeline_depth(requirements) if self.adaptive_depth else STANDARD
+        PIPELINE_DEPTH.inc(depth=depth)
+        print(f"Pipeline depth: {depth}")
+        return depth
+
+    def _lookup_recommendations(self, state: StackRecommendationState, update: Dict[str, Any]) -> Dict[str, Any]:
+        # recommendation cache first, then the stack catalog
+        update = {**update, "pipeline_depth": self._pipeline_depth(update["project_requirements"])}
+        update = self._with_cached_recommendations(state, update)
+        if update.get("cache_hit") or self.catalog is None:
+            return update
+
+        try:
+            stacks = self.catalog.lookup(update["project_requirements"])
+        except Exception as e:
+            print(f"Error reading stack catalog: {e}")
+            return update
+        if stacks is None:
+            return update
+
+        print(f"Stack catalog hit, reusing {len(stacks)} stacks and writing only the analysis")
+        return {**update, "recommended_stacks": stacks, "catalog_hit": True}
+
+    def _with_cached_recommendations(self, state: StackRecommendationState, update: Dict[str, Any]) -> Dict[str, Any]:
+        key = self._recommendation_key(state.query, update["project_requirements"], state.research_mode)
+        cached = self.recommendation_cache.get(key)
+        if cached is None:
+            return update
+
+        print("Recommendation cache hit, skipping research and generation")
+        return {
+            **update,
+            "recommended_stacks": [TechStack.model_validate(stack) for stack in cached["recommended_stacks"]],
+            "analysis": cached["analysis"],
+            "cache_hit": True,
+        }
+
+    def _cache_recommendations(self, state: StackRecommendationState, stacks: List[TechStack], analysis: str) -> None:
+        # failed generations come back empty and are not worth caching
+        if stacks and state.project_requirements:
+            key = self._recommendation_key(state.query, state.project_requirements, state.research_mode)
+            self.recommendation_cache.set(key, {
+                "recommended_stacks": [stack.model_dump() for stack in stacks],
+                "analysis": analysis,
+            })
+
+    def _remember_recommendations(self, state: StackRecommendationState, update: Dict[str, Any]) -> Dict[str, Any]:
+        self._cache_recommendations(state, update["recommended_stacks"], update["analysis"])
+        # lean stacks are written in the compact schema and would replace
+        # fuller write-ups of the same stack in the catalog
+        if state.pipeline_depth == LEAN:
+            return update
+        if update["recommended_stacks"] and state.project_requirements and self.catalog is not None:
+            try:
+                self.catalog.add(state.project_requirements, update["recommended_stacks"])
+            except Exception as e:
+                print(f"Error adding to stack catalog: {e}")
+        return update
+
+    def cache_stats(self) -> Dict[str, Any]:
+        stats = {
+            "recommendations": self.recommendation_cache.stats(),
+            "firecrawl": self.firecrawl.stats(),
+        }
+        if self.catalog is not None:
+            stats["catalog"] = self.catalog.stats()
+        if self.checkpointer is not None:
+            stats["checkpoints"] = self.checkpointer.stats()
+        return stats
+
+    def _requirements_prompt(self, state: StackRecommendationState) -> Prompt:
+        return self.prompt_builder.build(
+            "analyze_requirements",
+            self.prompts.REQUIREMENTS_ANALYSIS_SYSTEM,
+            self.prompts.requirements_analysis_user(state.query),
+        )
+
+    @staticmethod
+    def _with_prompt_report(step: str, prompt: Prompt, update: Dict[str, Any]) -> Dict[str, Any]:
+        return {**update, "prompt_tokens": {step: prompt.report}}
+
+    def _finish_requirements(self, state: StackRecommendationState, parser: IncrementalJSONParser) -> Dict[str, Any]:
+        if not parser.done:
+            print("Error analyzing requirements: response did not contain a complete JSON object")
+            return self._default_requirements()
+
+        try:
+            # missing fields fall back to the model defaults
+            requirements = ProjectRequirements.model_validate_json(parser.root_json)
+        except Exception as e:
+            print(f"Error analyzing requirements: {e}")
+            return self._default_requirements()
+
+        print(f"Project type: {requirements.project_type}, Scale: {requirements.scale}")
+        return self._lookup_recommendations(state, {"project_requirements": requirements})
+
+    def _default_requirements(self) -> Dict[str, Any]:
+        # Fallback to basic requirements
+        return {"project_requirements": ProjectRequirements()}
 
     def _analyze_requirements_step(self, state: StackRecommendationState) -> Dict[str, Any]:
         print(f"Analyzing project requirements: {state.query}")
+        # anything after the requirements object closes is ignored by the
+        # parser; the stream is still drained for the token usage chunk
+        parser = IncrementalJSONParser()
+        prompt = self._requirements_prompt(state)
+        try:
+            for chunk in self._stream_llm("analyze_requirements", prompt.messages):
+                parser.feed(chunk.content)
+        except Exception as e:
+            print(f"Error analyzing requirements: {e}")
+        return self._with_prompt_report("analyze_requirements", prompt, self._finish_requirements(state, parser))
 
-        messages = [
-            SystemMessage(content=self.prompts.REQUIREMENTS_ANALYSIS_SYSTEM),
-            HumanMessage(content=self.prompts.requirements_analysis_user(state.query))
-        ]
-
+    async def _aanalyze_requirements_step(self, state: StackRecommendationState) -> Dict[str, Any]:
+        print(f"Analyzing project requirements: {state.query}")
+        parser = IncrementalJSONParser()
+        prompt = self._requirements_prompt(state)
         try:
-            response = self.llm.invoke(messages)
-            json_str = response.content.strip()
-            
-            # Clean up JSON response
-            if json_str.startswith("```json"):
-                json_str = json_str.replace("```json", "").replace("```", "").strip()
-            elif json_str.startswith("```"):
-                json_str = json_str.replace("```", "").strip()
-            
-            requirements_data = json.loads(json_str)
-            
-            requirements = ProjectRequirements(
-                project_type=requirements_data.get("project_type", "Web App"),
-                scale=requirements_data.get("scale", "Medium"),
-                budget=requirements_data.get("budget", "Medium"),
-                timeline=requirements_data.get("timeline", "Weeks"),
-                team_experience=requirements_data.get("team_experience", "Intermediate"),
-                performance_needs=requirements_data.get("performance_needs", "Basic"),
-                special_requirements=requirements_data.get("special_requirements", [])
-            )
-            
-            print(f"Project type: {requirements.project_type}, Scale: {requirements.scale}")
-            return {"project_requirements": requirements}
-            
+            async for chunk in self._astream_llm("analyze_requirements", prompt.messages):
+                parser.feed(chunk.content)
         except Exception as e:
             print(f"Error analyzing requirements: {e}")
-            # Fallback to basic requirements
-            return {
-                "project_requirements": ProjectRequirements(
-                    project_type="Web App",
-                    scale="Medium",
-                    budget="Medium",
-                    timeline="Weeks",
-                    team_experience="Intermediate",
-                    performance_needs="Basic"
-                )
-            }
+        return self._with_prompt_report(
+            "analyze_requirements", prompt, await asyncio.to_thread(self._finish_requirements, state, parser)
+        )
 
     def _research_stacks_step(self, state: StackRecommendationState) -> Dict[str, Any]:
         requirements = state.project_requirements
@@ -93,106 +390,452 @@ class Workflow:
             f"tech stack comparison {requirements.project_type.lower()}"
         ]
 
-        all_content = ""
-        search_results = []
+        # searches fan out concurrently; hits are only scraped when the search
+        # payload came back without markdown
+        writer = get_stream_writer()
+        pages = self.firecrawl.research(
+            search_queries,
+            num_results=2,
+            on_progress=lambda progress: writer({"event": "research", "data": progress}),
+        )
 
-        for query in search_queries:
-            try:
-                results = self.firecrawl.search_companies(query, num_results=2)
-                if hasattr(results, 'data') and results.data:
-                    search_results.extend(results.data)
-                    for result in results.data:
-                        url = result.get("url", "")
-                        scraped = self.firecrawl.scrape_company_pages(url)
-                        if scraped and hasattr(scraped, 'markdown'):
-                            all_content += scraped.markdown[:1000] + "\n\n"
-            except Exception as e:
-                print(f"Error searching for {query}: {e}")
-                continue
+        # only the ranked snippets go into state; the full pages are dropped here
+        snippets = self.context_builder.build(pages, requirements)
+        print(f"Collected {len(pages)} pages, kept {len(snippets)} snippets, firecrawl stats: {self.firecrawl.stats()}")
 
-        return {"search_results": search_results}
+        return {"research_snippets": snippets}
 
-    def _generate_recommendations_step(self, state: StackRecommendationState) -> Dict[str, Any]:
-        print("Generating tech stack recommendations...")
+    async def _aresearch_stacks_step(self, state: StackRecommendationState) -> Dict[str, Any]:
+        # firecrawl only ships a blocking client, keep it off the event loop
+        return await asyncio.to_thread(self._research_stacks_step, state)
 
-        requirements = state.project_requirements
-        
-        messages = [
-            SystemMessage(content=self.prompts.STACK_RECOMMENDATION_SYSTEM),
-            HumanMessage(content=self.prompts.stack_recommendation_user(
-                state.query, 
-                requirements.model_dump_json()
-            ))
-        ]
+    def _recommendation_prompt(self, state: StackRecommendationState) -> Prompt:
+        return self.prompt_builder.build(
+            "generate_recommendations",
+            self.prompts.stack_recommendation_system(state.pipeline_depth, state.project_requirements.team_experience),
+            self.prompts.stack_recommendation_user(
+                state.query,
+                state.project_requirements.model_dump_json(),
+                format_snippets(state.research_snippets)
+            ),
+        )
 
+    def _collect_recommendation(self, path: tuple, text: str, stacks: List[TechStack], writer) -> None:
+        # stacks and their components are surfaced as soon as their closing
+        # brace arrives; a malformed object is skipped without losing the rest
         try:
-            response = self.llm.invoke(messages)
-            json_str = response.content.strip()
-            
-            # Clean up JSON response
-            if json_str.startswith("```json"):
-                json_str = json_str.replace("```json", "").replace("```", "").strip()
-            elif json_str.startswith("```"):
-                json_str = json_str.replace("```", "").strip()
-            
-            recommendations_data = json.loads(json_str)
-            
-            # Parse recommended stacks
-            stacks = []
-            for stack_data in recommendations_data.get("recommended_stacks", []):
-                components = []
-                for comp_data in stack_data.get("components", []):
-                    component = TechStackComponent(
-                        name=comp_data.get("name", ""),
-                        category=comp_data.get("category", ""),
-                        description=comp_data.get("description", ""),
-                        pros=comp_data.get("pros", []),
-                        cons=comp_data.get("cons", []),
-                        learning_curve=comp_data.get("learning_curve", "Medium"),
-                        popularity=comp_data.get("popularity", "Medium"),
-                        cost=comp_data.get("cost", "Free"),
-                        use_cases=comp_data.get("use_cases", [])
-                    )
-                    components.append(component)
-                
-                stack = TechStack(
-                    name=stack_data.get("name", ""),
-                    description=stack_data.get("description", ""),
-                    components=components,
-                    complexity=stack_data.get("complexity", "Moderate"),
-                    time_to_market=stack_data.get("time_to_market", "Medium"),
-                    scalability=stack_data.get("scalability", "Medium"),
-                    cost_estimate=stack_data.get("cost_estimate", ""),
-                    team_size_fit=stack_data.get("team_size_fit", "Small"),
-                    best_for=stack_data.get("best_for", []),
-                    industries=stack_data.get("industries", []),
-                    learning_resources=stack_data.get("learning_resources", [])
-                )
+            if len(path) == 4 and path[0] == "recommended_stacks" and path[2] == "components":
+                component = TechStackComponent.model_validate_json(text)
+                writer({"event": "component", "data": {"stack_index": path[1], "component": component}})
+            elif len(path) == 2 and path[0] == "recommended_stacks":
+                stack = TechStack.model_validate_json(text)
                 stacks.append(stack)
-            
-            analysis = recommendations_data.get("analysis", "Tech stack recommendations generated successfully.")
-            
-            return {
+                writer({"event": "stack", "data": stack})
+        except Exception as e:
+            print(f"Skipping malformed recommendation at {path}: {e}")
+
+    def _finish_recommendations(
+        self,
+        state: StackRecommendationState,
+        parser: IncrementalJSONParser,
+        stacks: List[TechStack],
+    ) -> Dict[str, Any]:
+        if parser.done:
+            # the stacks were validated as they closed; only the analysis is left
+            try:
+                analysis = RecommendationSummary.model_validate_json(parser.root_json).analysis
+            except Exception as e:
+                print(f"Error reading recommendation analysis: {e}")
+                analysis = RecommendationSummary().analysis
+            return self._remember_recommendations(state, {
                 "recommended_stacks": stacks,
                 "analysis": analysis
+            })
+
+        if stacks:
+            # keep what was parsed before the output broke off, but don't cache it
+            print(f"Recommendation output was cut short, keeping {len(stacks)} parsed stacks")
+            return {
+                "recommended_stacks": stacks,
+                "analysis": RecommendationSummary().analysis
             }
-            
+
+        return self._failed_recommendations()
+
+    def _failed_recommendations(self) -> Dict[str, Any]:
+        return {
+            "recommended_stacks": [],
+            "analysis": "Unable to generate recommendations due to an error."
+        }
+
+    def _generate_recommendations_step(self, state: StackRecommendationState) -> Dict[str, Any]:
+        print("Generating tech stack recommendations...")
+
+        parser = IncrementalJSONParser()
+        writer = get_stream_writer()
+        stacks: List[TechStack] = []
+        prompt = self._recommendation_prompt(state)
+        try:
+            for chunk in self._stream_llm("generate_recommendations", prompt.messages):
+                for path, text in parser.feed(chunk.content):
+                    self._collect_recommendation(path, text, stacks, writer)
         except Exception as e:
             print(f"Error generating recommendations: {e}")
-            return {
-                "recommended_stacks": [],
-                "analysis": "Unable to generate recommendations due to an error."
-            }
-    
-    def run(self, query: str) -> StackRecommendationState:
-        initial_state = StackRecommendationState(query=query)
+        return self._with_prompt_report(
+            "generate_recommendations", prompt, self._finish_recommendations(state, parser, stacks)
+        )
+
+    async def _agenerate_recommendations_step(self, state: StackRecommendationState) -> Dict[str, Any]:
+        print("Generating tech stack recommendations...")
+
+        parser = IncrementalJSONParser()
+        writer = get_stream_writer()
+        stacks: List[TechStack] = []
+        prompt = self._recommendation_prompt(state)
+        try:
+            async for chunk in self._astream_llm("generate_recommendations", prompt.messages):
+                for path, text in parser.feed(chunk.content):
+                    self._collect_recommendation(path, text, stacks, writer)
+        except Exception as e:
+            print(f"Error generating recommendations: {e}")
+        return self._with_prompt_report(
+            "generate_recommendations", prompt,
+            await asyncio.to_thread(self._finish_recommendations, state, parser, stacks),
+        )
+
+    def _catalog_analysis_prompt(self, state: StackRecommendationState) -> Prompt:
+        stacks = "\n".join(
+            f"- {stack.name}: {stack.description} ({', '.join(comp.name for comp in stack.components)})"
+            for stack in state.recommended_stacks
+        )
+        return self.prompt_builder.build(
+            "write_analysis",
+            self.prompts.CATALOG_ANALYSIS_SYSTEM,
+            self.prompts.catalog_analysis_user(
+                state.query,
+                state.project_requirements.model_dump_json(),
+                stacks
+            ),
+        )
+
+    def _finish_analysis(self, state: StackRecommendationState, parser: IncrementalJSONParser) -> Dict[str, Any]:
+        analysis = RecommendationSummary().analysis
+        if parser.done:
+            try:
+                analysis = RecommendationSummary.model_validate_json(parser.root_json).analysis
+            except Exception as e:
+                print(f"Error reading catalog analysis: {e}")
+        self._cache_recommendations(state, state.recommended_stacks, analysis)
+        return {"analysis": analysis}
+
+    def _write_analysis_step(self, state: StackRecommendationState) -> Dict[str, Any]:
+        print("Writing analysis for catalog stacks...")
+
+        parser = IncrementalJSONParser()
+        prompt = self._catalog_analysis_prompt(state)
+        try:
+            for chunk in self._stream_llm("write_analysis", prompt.messages):
+                parser.feed(chunk.content)
+        except Exception as e:
+            print(f"Error writing analysis: {e}")
+        return self._with_prompt_report("write_analysis", prompt, self._finish_analysis(state, parser))
+
+    async def _awrite_analysis_step(self, state: StackRecommendationState) -> Dict[str, Any]:
+        print("Writing analysis for catalog stacks...")
+
+        parser = IncrementalJSONParser()
+        prompt = self._catalog_analysis_prompt(state)
+        try:
+            async for chunk in self._astream_llm("write_analysis", prompt.messages):
+                parser.feed(chunk.content)
+        except Exception as e:
+            print(f"Error writing analysis: {e}")
+        return self._with_prompt_report(
+            "write_analysis", prompt, await asyncio.to_thread(self._finish_analysis, state, parser)
+        )
+
+    def _merge_research_step(self, state: StackRecommendationState) -> Dict[str, Any]:
+        # attach pages that mention a stack's components as supporting resources
+        if not state.research_snippets or not state.recommended_stacks:
+            return {}
+
+        stacks = []
+        for stack in state.recommended_stacks:
+            names = [comp.name.lower() for comp in stack.components if comp.name]
+            resources = list(stack.learning_resources)
+            for snippet in state.research_snippets:
+                text = f"{snippet.title} {snippet.text}".lower()
+                if snippet.url and snippet.url not in resources and any(name in text for name in names):
+                    resources.append(snippet.url)
+                    if len(resources) - len(stack.learning_resources) >= 3:
+                        break
+            stacks.append(stack.model_copy(update={"learning_resources": resources}))
+
+        return {"recommended_stacks": stacks}
+
+    def _failed_state(self, query: str, thread_id: Optional[str] = None) -> StackRecommendationState:
+        return StackRecommendationState(
+            query=query,
+            recommended_stacks=[],
+            analysis="Workflow failed to complete due to an error.",
+            thread_id=thread_id,
+        )
+
+    def _thread_config(self, thread_id: str, research_mode: str) -> Dict[str, Any]:
+        # the mode is saved with each checkpoint so a resumed thread keeps its topology
+        return {"configurable": {"thread_id": thread_id}, "metadata": {"research_mode": research_mode}}
+
+    def _plan_run(
+        self,
+        query: str,
+        research_mode: Optional[str] = None,
+        thread_id: Optional[str] = None,
+        regenerate: bool = False,
+    ) -> RunPlan:
+        """How to run a query: fresh, or picking up a checkpointed thread.
+
+        A known thread for the same query resumes after its last finished
+        node. A finished thread is returned as-is unless it came back
+        without stacks or regenerate is set; then it forks from the
+        checkpoint before generation, reusing the requirements and research.
+        """
+        research_mode = research_mode or self.research_mode
+        if self.checkpointer is None:
+            return RunPlan(self.graph(research_mode), StackRecommendationState(query=query, research_mode=research_mode), {})
+
+        snapshot = None
+        if thread_id:
+            config = {"configurable": {"thread_id": thread_id}}
+            snapshot = self.graph(research_mode).get_state(config)
+            mode = snapshot.metadata.get("research_mode") if snapshot.metadata else None
+            if mode in RESEARCH_MODES and mode != research_mode:
+                research_mode = mode
+                snapshot = self.graph(research_mode).get_state(config)
+            if not snapshot.values:
+                snapshot = None
+            elif normalize_key(snapshot.values["query"]) != normalize_key(query):
+                print(f"Thread {thread_id} is for another query, starting a new thread")
+                snapshot, thread_id = None, None
+
+        if snapshot is None:
+            thread_id = thread_id or uuid.uuid4().hex
+            return RunPlan(
+                self.graph(research_mode),
+                StackRecommendationState(query=query, thread_id=thread_id, research_mode=research_mode),
+                self._thread_config(thread_id, research_mode),
+            )
+
+        graph = self.graph(research_mode)
+        config = self._thread_config(thread_id, research_mode)
+        previous = StackRecommendationState(**snapshot.values)
+        if snapshot.next:
+            print(f"Resuming thread {thread_id} at {', '.join(snapshot.next)}")
+            return RunPlan(graph, None, config, previous)
+        if previous.recommended_stacks and not regenerate:
+            print(f"Thread {thread_id} already finished")
+            return RunPlan(graph, None, config, previous, finished=True)
+
+        fork = self._generation_checkpoint(graph, config)
+        if fork is None:
+            return RunPlan(
+                graph, StackRecommendationState(query=query, thread_id=thread_id, research_mode=research_mode), config
+            )
+        print(f"Regenerating thread {thread_id} from the checkpoint before generation")
+        previous = previous.model_copy(
+            update={"cache_hit": False, "catalog_hit": False, "recommended_stacks": [], "analysis": None}
+        )
+        return RunPlan(graph, None, {**fork, "metadata": config["metadata"]}, previous)
+
+    def _generation_checkpoint(self, graph, config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Config of the newest checkpoint about to generate recommendations"""
+        history = list(graph.get_state_history(config))
+        for snapshot in history:
+            if "generate_recommendations" in snapshot.next:
+                return snapshot.config
+
+        # served from the cache or catalog, so generation never ran: branch
+        # off the analysis with the hits cleared and let routing take over
+        for snapshot, parent in zip(history, history[1:]):
+            if parent.next == ("analyze_requirements",):
+                return graph.update_state(
+                    snapshot.config,
+                    {"cache_hit": False, "catalog_hit": False, "recommended_stacks": [], "analysis": None},
+                    as_node="analyze_requirements",
+                )
+        return None
+
+    @staticmethod
+    def _plan_thread(plan: RunPlan, thread_id: Optional[str]) -> Optional[str]:
+        return plan.config.get("configurable", {}).get("thread_id", thread_id)
+
+    def run(
+        self,
+        query: str,
+        research_mode: Optional[str] = None,
+        thread_id: Optional[str] = None,
+        regenerate: bool = False,
+    ) -> StackRecommendationState:
         try:
-            final_state = self.workflow.invoke(initial_state)
+            plan = self._plan_run(query, research_mode, thread_id, regenerate)
+            thread_id = self._plan_thread(plan, thread_id)
+            if plan.finished:
+                return plan.previous
+            final_state = plan.graph.invoke(plan.input, plan.config)
             return StackRecommendationState(**final_state)
         except Exception as e:
             print(f"Error running workflow: {e}")
-            return StackRecommendationState(
-                query=query,
-                recommended_stacks=[],
-                analysis="Workflow failed to complete due to an error."
-            )
\ No newline at end of file
+            return self._failed_state(query, thread_id)
+
+    async def arun(
+        self,
+        query: str,
+        research_mode: Optional[str] = None,
+        thread_id: Optional[str] = None,
+        regenerate: bool = False,
+    ) -> StackRecommendationState:
+        try:
+            plan = await asyncio.to_thread(self._plan_run, query, research_mode, thread_id, regenerate)
+            thread_id = self._plan_thread(plan, thread_id)
+            if plan.finished:
+                return plan.previous
+            final_state = await plan.graph.ainvoke(plan.input, plan.config)
+            return StackRecommendationState(**final_state)
+        except Exception as e:
+            print(f"Error running workflow: {e}")
+            return self._failed_state(query, thread_id)
+
+    def _batch_runs(
+        self, queries: List[str], max_concurrency: int, research_mode: Optional[str]
+    ) -> Tuple[Any, List[StackRecommendationState], Union[Dict[str, Any], List[Dict[str, Any]]]]:
+        research_mode = research_mode or self.research_mode
+        graph = self.graph(research_mode)
+        if self.checkpointer is None:
+            states = [StackRecommendationState(query=query, research_mode=research_mode) for query in queries]
+            return graph, states, {"max_concurrency": max_concurrency}
+
+        thread_ids = [uuid.uuid4().hex for _ in queries]
+        states = [
+            StackRecommendationState(query=query, thread_id=thread_id, research_mode=research_mode)
+            for query, thread_id in zip(queries, thread_ids)
+        ]
+        configs = [
+            {**self._thread_config(thread_id, research_mode), "max_concurrency": max_concurrency}
+            for thread_id in thread_ids
+        ]
+        return graph, states, configs
+
+    def batch(
+        self,
+        queries: List[str],
+        max_concurrency: int = 4,
+        research_mode: Optional[str] = None,
+    ) -> Iterator[Tuple[int, Union[StackRecommendationState, Exception]]]:
+        """Run many queries through the graph, yielding (index, result) as each finishes.
+
+        A failing query yields its exception instead of aborting the batch.
+        """
+        graph, states, config = self._batch_runs(queries, max_concurrency, research_mode)
+        outputs = graph.batch_as_completed(states, config=config, return_exceptions=True)
+        for index, output in outputs:
+            yield index, output if isinstance(output, Exception) else StackRecommendationState(**output)
+
+    async def abatch(
+        self,
+        queries: List[str],
+        max_concurrency: int = 4,
+        research_mode: Optional[str] = None,
+        slot: Optional[Callable[[], AsyncContextManager]] = None,
+    ) -> AsyncIterator[Tuple[int, Union[StackRecommendationState, Exception]]]:
+        """Async version of batch(); `slot` is entered around each query as it starts"""
+        graph, states, config = self._batch_runs(queries, max_concurrency, research_mode)
+        if slot is not None:
+            graph = self._gated(graph, slot)
+        outputs = graph.abatch_as_completed(states, config=config, return_exceptions=True)
+        async for index, output in outputs:
+            yield index, output if isinstance(output, Exception) else StackRecommendationState(**output)
+
+    @staticmethod
+    def _gated(graph, slot: Callable[[], AsyncContextManager]) -> RunnableLambda:
+        # langgraph starts at most max_concurrency queries at a time; each
+        # enters the slot only once it starts, not when the batch is submitted
+        async def run(state: StackRecommendationState, config: RunnableConfig) -> Dict[str, Any]:
+            async with slot():
+                return await graph.ainvoke(state, config)
+
+        return RunnableLambda(run)
+
+    async def astream(
+        self,
+        query: str,
+        research_mode: Optional[str] = None,
+        thread_id: Optional[str] = None,
+        regenerate: bool = False,
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """Yield (event, data) pairs as each graph node finishes.
+
+        Events: requirements, research (progress while searching and once
+        done), component and stack (as soon as the LLM finishes writing
+        each one), analysis, evidence (research folded into a stack in
+        parallel mode), done. A resumed thread replays what it already
+        has (requirements, catalog stacks, or the whole finished result)
+        before the nodes left to run.
+        """
+        cache_hit = catalog_hit = False
+        timings: Dict[str, float] = {}
+        prompt_tokens: Dict[str, Dict[str, int]] = {}
+        try:
+            plan = await asyncio.to_thread(self._plan_run, query, research_mode, thread_id, regenerate)
+            thread_id = self._plan_thread(plan, thread_id)
+            previous = plan.previous
+            if previous is not None:
+                cache_hit, catalog_hit = previous.cache_hit, previous.catalog_hit
+                timings.update(previous.timings)
+                prompt_tokens.update(previous.prompt_tokens)
+                if previous.project_requirements:
+                    yield "requirements", previous.project_requirements
+                if plan.finished or previous.catalog_hit:
+                    for stack in previous.recommended_stacks:
+                        yield "stack", stack
+                if plan.finished:
+                    if previous.analysis:
+                        yield "analysis", previous.analysis
+                    yield "done", {
+                        "cache_hit": cache_hit, "catalog_hit": catalog_hit, "timings": timings,
+                        "prompt_tokens": prompt_tokens, "thread_id": thread_id,
+                    }
+                    return
+
+            async for mode, chunk in plan.graph.astream(plan.input, plan.config, stream_mode=["updates", "custom"]):
+                if mode == "custom":
+                    yield chunk["event"], chunk["data"]
+                    continue
+
+                for node, update in chunk.items():
+                    if not update:
+                        continue
+                    cache_hit = cache_hit or update.get("cache_hit", False)
+                    catalog_hit = catalog_hit or update.get("catalog_hit", False)
+                    timings.update(update.get("timings", {}))
+                    prompt_tokens.update(update.get("prompt_tokens", {}))
+                    if "project_requirements" in update:
+                        yield "requirements", update["project_requirements"]
+                    if node == "research_stacks":
+                        yield "research", {"status": "complete", "snippets": len(update.get("research_snippets", []))}
+                    if node == "merge_research":
+                        for index, stack in enumerate(update.get("recommended_stacks", [])):
+                            yield "evidence", {"stack_index": index, "learning_resources": stack.learning_resources}
+                    # generated stacks were already streamed as they were parsed
+                    elif node != "generate_recommendations":
+                        for stack in update.get("recommended_stacks", []):
+                            yield "stack", stack
+                    if update.get("analysis"):
+                        yield "analysis", update["analysis"]
+        except Exception as e:
+            print(f"Error streaming workflow: {e}")
+            yield "error", {"message": "Workflow failed to complete due to an error."}
+            return
+
+        yield "done", {
+            "cache_hit": cache_hit, "catalog_hit": catalog_hit, "timings": timings,
+            "prompt_tokens": prompt_tokens, "thread_id": thread_id,
+        }